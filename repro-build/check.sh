@@ -21,6 +21,9 @@ BB_DIR_A=${BB_DIR_A:-${BUILD_DIR_A}/bb-build}
 BB_DIR_B=${BB_DIR_B:-${BUILD_DIR_B}/bb-build}
 ROOTFS_A=${BB_DIR_A}/${ROOTFS_PATH}
 ROOTFS_B=${BB_DIR_B}/${ROOTFS_PATH}
+# Manifests and the digest cache for the rootfs comparison, reused across runs
+MANIFEST_DIR=${MANIFEST_DIR:-${THIS_DIR}/manifests}
+REPORT_JSON=${REPORT_JSON:-${MANIFEST_DIR}/report.json}
 
 # Only compare these image paths (relative to $BUILD_DIR_*/images).
 # Everything else is ignored to avoid known non-reproducible artifacts.
@@ -180,8 +183,28 @@ check() {
 
     echo -e "${YELLOW}Checking rootfs...${NC}: $ROOTFS_A -> $ROOTFS_B"
     local differences=0
-    check_files "$ROOTFS_A" "$ROOTFS_B" ""
-    differences=$?
+    if command -v python3 >/dev/null 2>&1; then
+        python3 "$THIS_DIR/rootfs_manifest.py" "$ROOTFS_A" "$ROOTFS_B" \
+            --out-dir "$MANIFEST_DIR" --json "$REPORT_JSON"
+        local status=$?
+        case $status in
+            0|1)
+                echo "Report written to $REPORT_JSON"
+                differences=$(python3 -c 'import json, sys; print(len(json.load(open(sys.argv[1]))["differences"]))' \
+                    "$REPORT_JSON") || {
+                    echo -e "${RED}Failed to read $REPORT_JSON${NC}"
+                    return 2
+                }
+                ;;
+            *)
+                echo -e "${RED}rootfs_manifest.py failed with exit status $status${NC}"
+                return 2
+                ;;
+        esac
+    else
+        check_files "$ROOTFS_A" "$ROOTFS_B" ""
+        differences=$?
+    fi
 
     if [ $differences -eq 0 ]; then
         echo -e "\n${GREEN}All files are identical!${NC}"
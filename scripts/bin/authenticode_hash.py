@@ -16,10 +16,13 @@ def read_le_u32(data: bytes, offset: int) -> int:
     return struct.unpack('<I', data[offset:offset + 4])[0]
 
 
-def authenticode_hash(filepath: str) -> str:
+def authenticode_hash(filepath: str, algorithm: str = 'sha256') -> str:
     with open(filepath, 'rb') as f:
         data = f.read()
+    return authenticode_hash_data(data, algorithm, filepath)
 
+
+def authenticode_hash_data(data: bytes, algorithm: str = 'sha256', name: str = '<data>') -> str:
     # Read DOS header
     lfanew_offset = 0x3C
     lfanew = read_le_u32(data, lfanew_offset)
@@ -29,7 +32,7 @@ def authenticode_hash(filepath: str) -> str:
     pe_sig = read_le_u32(data, pe_sig_offset)
     IMAGE_NT_SIGNATURE = 0x00004550  # "PE\0\0"
     if pe_sig != IMAGE_NT_SIGNATURE:
-        raise ValueError(f"Invalid PE signature in {filepath}")
+        raise ValueError(f"Invalid PE signature in {name}")
 
     # Read COFF header
     coff_header_offset = pe_sig_offset + 4
@@ -54,7 +57,7 @@ def authenticode_hash(filepath: str) -> str:
     size_of_headers = read_le_u32(data, size_of_headers_offset)
 
     # Hash header (excluding checksum and cert directory)
-    hasher = hashlib.sha256()
+    hasher = hashlib.new(algorithm)
     hasher.update(data[0:checksum_offset])
     hasher.update(data[checksum_end:cert_dir_offset])
     hasher.update(data[cert_dir_end:size_of_headers])
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+"""
+Microbenchmarks for the per-deploy hot paths of the dstack tooling.
+
+Cases:
+  authenticode_hash   synthetic PE/COFF files of several sizes
+  run_instance        QEMU command line build (dry run) with a fake sysfs
+                      and GPU/NVSwitch topologies
+  encrypt_env         dstack-cloud _encrypt_env on large .env files
+  app_compose         dstack-cloud _generate_app_compose/_generate_sys_config
+  host_api            GetSealingKey through the host API against a fake
+                      key provider
+
+Absolute timings only mean something on the machine that produced them,
+so no baseline is shipped: record one locally with --save-baseline (into
+bench-baseline.json next to this script, which is not tracked) before
+making a change, then rerun to compare. Slowdowns beyond the tolerance are
+reported as warnings; --strict makes them fail the run.
+
+Usage:
+    bench.py [--filter SUBSTR] [--save-baseline] [--tolerance 0.5] [--strict]
+"""
+
+import argparse
+import contextlib
+import importlib.machinery
+import io
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+BASELINE_FILE = os.path.join(SCRIPT_DIR, "bench-baseline.json")
+DEFAULT_TOLERANCE = 0.5
+
+
+def timeit(fn: Callable[[], None], min_time: float = 0.2, repeat: int = 5) -> float:
+    """Return the best per-call time of fn in seconds.
+
+    The number of calls per round is scaled so that each round runs for at
+    least min_time; the fastest of `repeat` rounds is reported.
+    """
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def load_dstack_cloud():
+    """Load the dstack-cloud script (no .py extension) as a module."""
+    path = os.path.join(SCRIPT_DIR, "dstack-cloud")
+    return importlib.machinery.SourceFileLoader("dstack_cloud", path).load_module()
+
+
+def write_pe(path: str, size: int, sections: int = 8) -> None:
+    """Write a minimal PE32+ image of about `size` bytes split into sections."""
+    header_size = 0x400
+    section_size = max((size - header_size) // sections // 0x200 * 0x200, 0x200)
+    data = bytearray(header_size + section_size * sections)
+    struct.pack_into("<I", data, 0x3C, 0x80)
+    data[0x80:0x84] = b"PE\0\0"
+    opt_header_size = 240
+    struct.pack_into("<HHIIIHH", data, 0x84, 0x8664, sections, 0, 0, 0, opt_header_size, 0x22)
+    opt = 0x98
+    struct.pack_into("<H", data, opt, 0x20B)
+    struct.pack_into("<I", data, opt + 60, header_size)
+    table = opt + opt_header_size
+    for i in range(sections):
+        offset = header_size + i * section_size
+        struct.pack_into("<8sIIII", data, table + i * 40, f".s{i}".encode(),
+                         section_size, offset, section_size, offset)
+    # Non-zero payload so hashing cannot take shortcuts
+    pattern = bytes(range(256)) * 16
+    for offset in range(header_size, len(data), len(pattern)):
+        chunk = pattern[:len(data) - offset]
+        data[offset:offset + len(chunk)] = chunk
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def bench_authenticode(tmp: str) -> Dict[str, float]:
+    from authenticode_hash import authenticode_hash
+
+    results = {}
+    for label, size in (("64k", 64 << 10), ("4m", 4 << 20), ("32m", 32 << 20)):
+        path = os.path.join(tmp, f"pe-{label}.efi")
+        write_pe(path, size)
+        results[f"authenticode_hash/{label}"] = timeit(lambda: authenticode_hash(path))
+    return results
+
+
+def make_fake_sysfs(root: str, slots: List[str], numa_nodes: int, cpus_per_node: int) -> None:
+    for i, slot in enumerate(slots):
+        dev_dir = os.path.join(root, "bus", "pci", "devices", f"0000:{slot}")
+        os.makedirs(dev_dir, exist_ok=True)
+        with open(os.path.join(dev_dir, "numa_node"), "w") as f:
+            f.write(f"{i * numa_nodes // len(slots)}\n")
+    for node in range(numa_nodes):
+        node_dir = os.path.join(root, "devices", "system", "node", f"node{node}")
+        os.makedirs(node_dir, exist_ok=True)
+        with open(os.path.join(node_dir, "cpulist"), "w") as f:
+            f.write(f"{node * cpus_per_node}-{(node + 1) * cpus_per_node - 1}\n")
+
+
+def bench_run_instance(tmp: str) -> Dict[str, float]:
+    import dstack
+
+    image_dir = os.path.join(tmp, "image")
+    os.makedirs(image_dir, exist_ok=True)
+    with open(os.path.join(image_dir, "metadata.json"), "w") as f:
+        json.dump({"bios": "ovmf.fd", "kernel": "bzImage", "initrd": "initramfs.cpio.gz",
+                   "rootfs": "rootfs.img.verity", "cmdline": "console=ttyS0 init=/init"}, f)
+    with open(os.path.join(image_dir, "digest.txt"), "w") as f:
+        f.write("0" * 64)
+
+    topologies = {
+        "no-gpu": ([], [], 1, False),
+        "8gpu": ([f"{0x18 + i * 0x10:02x}:00.0" for i in range(8)], [], 2, False),
+        "8gpu-4nvswitch-hugepages": ([f"{0x18 + i * 0x10:02x}:00.0" for i in range(8)],
+                                     [f"{0x05 + i:02x}:00.0" for i in range(4)], 2, True),
+    }
+
+    manager = dstack.DstackManager()
+    old_sysfs = dstack.SYSFS_ROOT
+    results = {}
+    try:
+        for label, (gpus, bridges, numa_nodes, hugepages) in topologies.items():
+            sysfs = os.path.join(tmp, f"sysfs-{label}")
+            make_fake_sysfs(sysfs, gpus + bridges or ["00:00.0"], numa_nodes, 32)
+            dstack.SYSFS_ROOT = sysfs
+
+            vm_dir = os.path.join(tmp, f"vm-{label}")
+            os.makedirs(os.path.join(vm_dir, "shared"), exist_ok=True)
+            open(os.path.join(vm_dir, "hda.img"), "w").close()
+            manifest = {
+                "id": label, "name": label, "vcpu": 32, "memory": 65536, "disk_size": 100,
+                "image_path": image_dir, "port_map": [
+                    {"protocol": "tcp", "address": "127.0.0.1", "from": 8000 + i, "to": 80 + i}
+                    for i in range(16)
+                ],
+                "gpus": {"gpus": [{"slot": s} for s in gpus],
+                         "bridges": [{"slot": s} for s in bridges]},
+                "hugepages": hugepages, "pin_numa": bool(gpus),
+            }
+            with open(os.path.join(vm_dir, "vm-manifest.json"), "w") as f:
+                json.dump(manifest, f)
+
+            def run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    manager.run_instance(vm_dir, 12345, dry_run=True)
+            results[f"run_instance/{label}"] = timeit(run)
+    finally:
+        dstack.SYSFS_ROOT = old_sysfs
+    return results
+
+
+def bench_encrypt_env(tmp: str) -> Dict[str, float]:
+    dc = load_dstack_cloud()
+    manager = dc.CloudDeploymentManager(tmp)
+    pubkey = os.urandom(32).hex()
+    results = {}
+    for count in (100, 10000):
+        envs = {f"VAR_{i}": "x" * 64 for i in range(count)}
+        try:
+            manager._encrypt_env(envs, pubkey)
+        except ImportError as e:
+            print(f"Skipping encrypt_env: {str(e).splitlines()[0]}", file=sys.stderr)
+            return {}
+        results[f"encrypt_env/{count}"] = timeit(lambda: manager._encrypt_env(envs, pubkey))
+    return results
+
+
+def bench_app_compose(tmp: str) -> Dict[str, float]:
+    dc = load_dstack_cloud()
+    project = os.path.join(tmp, "project")
+    os.makedirs(project, exist_ok=True)
+    services = "".join(
+        f"  svc{i}:\n    image: example/svc{i}:latest\n    ports:\n      - \"{8000 + i}:80\"\n"
+        for i in range(200)
+    )
+    with open(os.path.join(project, "docker-compose.yaml"), "w") as f:
+        f.write("services:\n" + services)
+    with open(os.path.join(project, "prelaunch.sh"), "w") as f:
+        f.write("#!/bin/sh\n" + "echo prelaunch\n" * 100)
+
+    manager = dc.CloudDeploymentManager(project)
+    app = dc.App(allowed_envs=[f"VAR_{i}" for i in range(500)])
+    env_names = [f"ENV_{i}" for i in range(500)]
+    gcp_config = dc.GcpConfig()
+    global_config = {"services": {"kms_urls": ["https://kms.example:12001"],
+                                  "gateway_urls": ["https://gateway.example:12002"]},
+                     "image_search_paths": [tmp]}
+
+    logger = dc.logger
+    level = logger.level
+    logger.setLevel("WARNING")
+    try:
+        return {
+            "app_compose/generate": timeit(lambda: manager._generate_app_compose(app, env_names)),
+            "sys_config/generate": timeit(
+                lambda: manager._generate_sys_config(global_config, gcp_config, app)),
+        }
+    finally:
+        logger.setLevel(level)
+
+
+def bench_host_api(tmp: str) -> Dict[str, float]:
+    import http.client
+
+    from host_api_testing import FakeKeyProvider, start_host_api
+
+    vm_dir = os.path.join(tmp, "vm-host-api")
+    os.makedirs(os.path.join(vm_dir, "shared"), exist_ok=True)
+    kp = FakeKeyProvider().start()
+    server, port = start_host_api(vm_dir, kp.port)
+    body = json.dumps({"quote": os.urandom(5000).hex()})
+
+    def request():
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        conn.request("POST", "/api/GetSealingKey", body=body,
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        if response.status != 200:
+            raise RuntimeError(f"GetSealingKey returned {response.status}")
+
+    # BaseHTTPRequestHandler logs every request to stderr
+    try:
+        with contextlib.redirect_stderr(io.StringIO()):
+            return {"host_api/get_sealing_key": timeit(request)}
+    finally:
+        server.shutdown()
+        kp.shutdown()
+
+
+BENCHMARKS = {
+    "authenticode_hash": bench_authenticode,
+    "run_instance": bench_run_instance,
+    "encrypt_env": bench_encrypt_env,
+    "app_compose": bench_app_compose,
+    "host_api": bench_host_api,
+}
+
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run dstack tooling microbenchmarks')
+    parser.add_argument('--filter', '-k', type=str, default='',
+                        help='Only run benchmark groups containing this string')
+    parser.add_argument('--baseline', type=str, default=BASELINE_FILE,
+                        help='Baseline file to compare against (default: bench-baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store the results of this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed slowdown relative to the baseline (default: 0.5)')
+    parser.add_argument('--strict', action='store_true',
+                        help='Exit with status 1 if any benchmark regressed')
+    args = parser.parse_args()
+
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for group, bench in BENCHMARKS.items():
+            if args.filter in group:
+                results.update(bench(tmp))
+
+    try:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+        if not args.save_baseline:
+            print(f"No baseline at {args.baseline}; run with --save-baseline to record one",
+                  file=sys.stderr)
+
+    regressions = []
+    print(f"{'BENCHMARK':40} {'TIME':>12} {'BASELINE':>12} {'RATIO':>7}")
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base:
+            ratio = seconds / base
+            print(f"{name:40} {format_time(seconds):>12} {format_time(base):>12} {ratio:>6.2f}x")
+            if ratio > 1 + args.tolerance:
+                regressions.append(name)
+        else:
+            print(f"{name:40} {format_time(seconds):>12} {'-':>12} {'-':>7}")
+
+    if args.save_baseline:
+        baseline.update({name: round(seconds, 9) for name, seconds in results.items()})
+        with open(args.baseline, "w") as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        prefix = "Regressions" if args.strict else "Warning: regressions"
+        print(f"{prefix} over {args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        if args.strict:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,8 +10,6 @@ import string
 import subprocess
 import uuid
 import configparser
-import host_api
-import threading
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
@@ -24,6 +22,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Root of the sysfs tree read for NUMA topology (overridable for tests and benchmarks)
+SYSFS_ROOT = '/sys'
+
 
 def generate_config_paths():
     paths = [
@@ -71,6 +72,78 @@ def test_merge_dicts():
     assert merge_dicts({"a": 1}, {"a": 2}, {"c": 3}) == {"a": 2, "c": 3}
 
 
+# Import-time budget for loading dstack.py / dstack-cloud, excluding interpreter startup
+STARTUP_IMPORT_BUDGET_MS = 150
+
+
+def import_profile(script_path):
+    """
+    Load a script with 'python -X importtime' and return (milliseconds, modules).
+
+    The script is imported as module '_profiled', which is included in the
+    returned modules. Only imports made while loading the script are counted;
+    modules imported by the interpreter itself at startup are excluded.
+
+    Raises:
+        RuntimeError: If loading the script fails
+    """
+    import sys
+
+    def run(code):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(script_path)))
+        if result.returncode != 0:
+            raise RuntimeError(f"Loading {script_path} failed:\n{result.stderr[-2000:]}")
+        entries = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            entries.append((int(cumulative), name))
+        return entries
+
+    baseline = {name.strip() for _, name in run('pass')}
+    # The script has no .py suffix, so a finder maps the name to it; importing
+    # through the import system is what makes -X importtime report it.
+    loader = ("import importlib.machinery, importlib.util, sys\n"
+              "class Finder:\n"
+              "    @staticmethod\n"
+              "    def find_spec(name, path=None, target=None):\n"
+              "        if name != '_profiled':\n"
+              "            return None\n"
+              "        loader = importlib.machinery.SourceFileLoader(\n"
+              f"            name, {os.path.abspath(script_path)!r})\n"
+              "        return importlib.util.spec_from_loader(name, loader)\n"
+              "sys.meta_path.insert(0, Finder)\n"
+              "import _profiled\n")
+    total_us = 0
+    modules = set()
+    for cumulative, name in run(loader):
+        if name.strip() in baseline:
+            continue
+        modules.add(name.strip())
+        # Top-level entries already include their nested imports
+        if not name.startswith('  '):
+            total_us += cumulative
+    return total_us / 1000, modules
+
+
+def test_startup_imports():
+    this_dir = os.path.dirname(os.path.abspath(__file__))
+    lazy = {
+        'dstack.py': {'host_api', 'http.server', 'socketserver'},
+        'dstack-cloud': {'cryptography', 'eth_keys', 'eth_utils', 'urllib.request', 'ssl',
+                         'tarfile', 'concurrent.futures'},
+    }
+    for script, forbidden in lazy.items():
+        elapsed_ms, modules = import_profile(os.path.join(this_dir, script))
+        assert '_profiled' in modules, f"{script} was not loaded"
+        assert not modules & forbidden, f"{script} imports {modules & forbidden} at startup"
+        assert elapsed_ms < STARTUP_IMPORT_BUDGET_MS, \
+            f"{script} imports took {elapsed_ms:.1f} ms (budget {STARTUP_IMPORT_BUDGET_MS} ms)"
+
+
 def round_up(value, multiple):
     """
     Round up a value to the nearest multiple of another value.
@@ -93,6 +166,72 @@ def round_up(value, multiple):
     return value + (multiple - remainder)
 
 
+# Upper bounds for the vcpu-scaled virtio queue counts
+MAX_DISK_QUEUES = 16
+MAX_NET_QUEUES = 8
+
+
+def default_io_config(vcpu, disk_queues=None, net_queues=None, iothreads=True,
+                      cache='none', aio='io_uring'):
+    """
+    Build the 'io' section of a VM manifest.
+
+    Queue counts default to one per vCPU, capped at MAX_DISK_QUEUES and
+    MAX_NET_QUEUES.
+
+    Returns:
+        dict: iothreads, disk_queues, net_queues, cache and aio settings
+    """
+    return {
+        "iothreads": iothreads,
+        "disk_queues": disk_queues or max(1, min(vcpu, MAX_DISK_QUEUES)),
+        "net_queues": net_queues or max(1, min(vcpu, MAX_NET_QUEUES)),
+        "cache": cache,
+        "aio": aio,
+    }
+
+
+def virtio_disk_args(index, drive_opts, io_cfg):
+    """
+    QEMU arguments for a virtio-blk disk tuned by the manifest 'io' section.
+
+    Each disk gets its own iothread when enabled. Without an 'io' section
+    the plain single-queue device is used, as for manifests created before
+    the section existed.
+    """
+    drive_id = f'virtio-disk{index}'
+    device = f'virtio-blk-pci,drive={drive_id}'
+    args = []
+    if io_cfg:
+        if io_cfg.get('cache'):
+            drive_opts += f",cache={io_cfg['cache']}"
+        if io_cfg.get('aio'):
+            drive_opts += f",aio={io_cfg['aio']}"
+        if io_cfg.get('iothreads'):
+            args.extend(['-object', f'iothread,id=iothread{index}'])
+            device += f',iothread=iothread{index}'
+        if io_cfg.get('disk_queues', 1) > 1:
+            device += f",num-queues={io_cfg['disk_queues']}"
+    args.extend([
+        '-drive', f'{drive_opts},if=none,id={drive_id}',
+        '-device', device,
+    ])
+    return args
+
+
+def test_virtio_disk_args():
+    assert virtio_disk_args(1, 'file=hda.img', None) == [
+        '-drive', 'file=hda.img,if=none,id=virtio-disk1',
+        '-device', 'virtio-blk-pci,drive=virtio-disk1']
+    io_cfg = default_io_config(32)
+    assert io_cfg['disk_queues'] == MAX_DISK_QUEUES and io_cfg['net_queues'] == MAX_NET_QUEUES
+    assert virtio_disk_args(0, 'file=rootfs.img,format=raw', io_cfg) == [
+        '-object', 'iothread,id=iothread0',
+        '-drive', 'file=rootfs.img,format=raw,cache=none,aio=io_uring,if=none,id=virtio-disk0',
+        '-device', 'virtio-blk-pci,drive=virtio-disk0,iothread=iothread0,num-queues=16']
+    assert default_io_config(2)['disk_queues'] == 2
+
+
 def ini_to_dict(filename):
     config = configparser.ConfigParser()
     config.read(filename)
@@ -125,12 +264,13 @@ def update_guest_config(config_file: str, data: Dict):
         json.dump(config, f, indent=4)
 
 
-def gen_vm_config(vm_dir, host_port, manifest=None, os_image_hash=None):
+def gen_vm_config(vm_dir, host_port, manifest=None, os_image_hash=None, host_address=None):
     shared_dir = os.path.join(vm_dir, 'shared')
+    host_address = host_address or GUEST_GATEWAY
     for filename in ['config.json', '.sys-config.json']:
         config_file = os.path.join(shared_dir, filename)
         update_guest_config(config_file, {
-            "host_api_url": f"http://10.0.2.2:{host_port}/api",
+            "host_api_url": f"http://{host_address}:{host_port}/api",
             "host_vsock_port": host_port
         })
         if manifest:
@@ -143,12 +283,357 @@ def gen_vm_config(vm_dir, host_port, manifest=None, os_image_hash=None):
             })
 
 
+def spawn_socket_daemon(cmd: List[str], socket_path: str, name: str,
+                        timeout: float = 5) -> subprocess.Popen:
+    """
+    Start a helper daemon that serves on a unix socket and wait for the socket.
+
+    Raises:
+        RuntimeError: If the daemon is missing, exits early or never creates the socket
+    """
+    import time
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    try:
+        proc = subprocess.Popen(cmd)
+    except FileNotFoundError:
+        raise RuntimeError(f"{name} not found: {cmd[0]}")
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socket_path):
+        if proc.poll() is not None:
+            raise RuntimeError(f"{name} exited with status {proc.returncode}")
+        if time.monotonic() > deadline:
+            stop_daemon(proc)
+            raise RuntimeError(f"Timed out waiting for the {name} socket")
+        time.sleep(0.05)
+    return proc
+
+
+def stop_daemon(proc: Optional[subprocess.Popen]) -> None:
+    if proc is None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+NETWORK_MODES = ('user', 'tap', 'passt')
+# Guest-side addressing of the user and passt backends; the gateway reaches the host
+GUEST_GATEWAY = '10.0.2.2'
+GUEST_ADDRESS = '10.0.2.15'
+DEFAULT_BRIDGE = 'virbr0'
+
+
+def network_config(instance_id, mode='user', bridge=None, guest_ip=None, port_map=None):
+    """
+    Build the 'network' section of a VM manifest.
+
+    Modes:
+        user:  QEMU user-mode networking (slirp), port_map via hostfwd
+        tap:   tap device on a host bridge with vhost-net and multiqueue,
+               port_map via nftables DNAT to guest_ip. Nothing assigns
+               guest_ip to the guest: reserve it for the derived MAC on the
+               bridge's DHCP server (or configure it statically).
+        passt: passt over a unix socket, port_map via passt port forwards
+    """
+    if mode not in NETWORK_MODES:
+        raise ValueError(f"Invalid network mode: {mode}")
+    network = {"mode": mode}
+    if mode == 'tap':
+        if port_map and not guest_ip:
+            raise ValueError("Port mapping in tap mode requires --guest-ip")
+        digest = uuid.uuid5(uuid.NAMESPACE_OID, instance_id).hex
+        network.update({
+            "bridge": bridge or DEFAULT_BRIDGE,
+            "tap": f"dstack-{digest[:8]}",
+            "mac": "52:54:00:" + ":".join(digest[i:i + 2] for i in range(0, 6, 2)),
+            "guest_ip": guest_ip,
+        })
+    return network
+
+
+class VmNetwork:
+    """Host side of a VM's network backend: QEMU arguments, setup and teardown."""
+
+    def __init__(self, vm_dir: str, manifest: dict):
+        self.vm_dir = vm_dir
+        self.port_map = manifest.get('port_map', [])
+        self.net_queues = (manifest.get('io') or {}).get('net_queues', 1)
+        self.config = manifest.get('network') or {"mode": "user"}
+        self.mode = self.config['mode']
+        if self.mode not in NETWORK_MODES:
+            raise ValueError(f"Invalid network mode: {self.mode}")
+        self.passt = None
+        # Host API port; in tap mode only this VM's MAC may reach it on the bridge
+        self.host_api_port = None
+        self.saved_route_localnet = None
+
+    @classmethod
+    def from_vm_dir(cls, vm_dir: str) -> 'VmNetwork':
+        manifest_path = os.path.join(vm_dir, 'vm-manifest.json')
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"VM manifest not found in {vm_dir}")
+        with open(manifest_path, 'r') as f:
+            return cls(vm_dir, json.load(f))
+
+    @property
+    def passt_socket(self) -> str:
+        return os.path.join(os.path.abspath(self.vm_dir), 'passt.sock')
+
+    @property
+    def nft_table(self) -> str:
+        return self.config['tap']
+
+    @property
+    def route_localnet_path(self) -> str:
+        return f"/proc/sys/net/ipv4/conf/{self.config['bridge']}/route_localnet"
+
+    def forwards_loopback(self) -> bool:
+        """Whether any port_map listens on a loopback or wildcard address."""
+        return any(
+            address.startswith('127.') or address in ('0.0.0.0', '')
+            for address in (port_map.get('address', '127.0.0.1') for port_map in self.port_map))
+
+    def bridge_address(self) -> str:
+        """First IPv4 address of the bridge, used by the guest to reach the host."""
+        result = subprocess.run(['ip', '-j', '-4', 'addr', 'show', 'dev', self.config['bridge']],
+                                capture_output=True, text=True)
+        if result.returncode == 0:
+            for link in json.loads(result.stdout or '[]'):
+                for addr in link.get('addr_info', []):
+                    return addr['local']
+        raise RuntimeError(f"Bridge {self.config['bridge']} has no IPv4 address")
+
+    def host_address(self) -> str:
+        """Address the guest uses to reach host services such as the host API."""
+        if self.mode == 'tap':
+            return self.bridge_address()
+        return GUEST_GATEWAY
+
+    def host_api_bind_address(self) -> str:
+        """Listen address for the host API; tap guests connect through the bridge."""
+        if self.mode == 'tap':
+            return self.bridge_address()
+        return 'localhost'
+
+    def qemu_args(self) -> List[str]:
+        if self.mode == 'user':
+            port_args = []
+            for port_map in self.port_map:
+                protocol = port_map.get('protocol', 'tcp')
+                bind_address = port_map.get('address', '127.0.0.1')
+                port_args.append(
+                    f"hostfwd={protocol}:{bind_address}:{port_map['from']}-:{port_map['to']}")
+            # io.net_queues is not applied here: slirp always has a single queue
+            return [
+                '-device', 'virtio-net-pci,netdev=nic0_td',
+                '-netdev', f"user,id=nic0_td{','+','.join(port_args) if len(port_args) > 0 else ''}"
+            ]
+        if self.mode == 'passt':
+            return [
+                '-device', 'virtio-net-pci,netdev=nic0_td',
+                '-netdev', f'stream,id=nic0_td,server=off,addr.type=unix,addr.path={self.passt_socket}',
+            ]
+        netdev = f"tap,id=nic0_td,ifname={self.config['tap']},script=no,downscript=no,vhost=on"
+        device = f"virtio-net-pci,netdev=nic0_td,mac={self.config['mac']}"
+        if self.net_queues > 1:
+            netdev += f',queues={self.net_queues}'
+            device += f',mq=on,vectors={2 * self.net_queues + 2}'
+        return ['-device', device, '-netdev', netdev]
+
+    def passt_command(self) -> List[str]:
+        cmd = ['passt', '--foreground', '--quiet', '--socket', self.passt_socket,
+               '--address', GUEST_ADDRESS, '--netmask', '24', '--gateway', GUEST_GATEWAY]
+        for port_map in self.port_map:
+            flag = '-u' if port_map.get('protocol', 'tcp') == 'udp' else '-t'
+            address = port_map.get('address', '127.0.0.1')
+            cmd.extend([flag, f"{address}/{port_map['from']}:{port_map['to']}"])
+        return cmd
+
+    def nft_ruleset(self) -> str:
+        """nftables rules of a tap VM: DNAT of port_map entries to the guest,
+        and a filter keeping other guests on the bridge off the host API."""
+        guest_ip = self.config['guest_ip']
+        rules = []
+        for port_map in self.port_map:
+            protocol = port_map.get('protocol', 'tcp')
+            address = port_map.get('address', '127.0.0.1')
+            match = (f'ip daddr {address} ' if address not in ('0.0.0.0', '')
+                     else 'fib daddr type local ')
+            rules.append(f"{match}{protocol} dport {port_map['from']} dnat to {guest_ip}:{port_map['to']}")
+        table = f'ip {self.nft_table}'
+        lines = [f'table {table} {{}}', f'delete table {table}', f'table {table} {{']
+        if self.host_api_port:
+            # The host API is unauthenticated and listens on the bridge address
+            lines.append('  chain input {\n    type filter hook input priority 0; policy accept;')
+            lines.append(f"    iifname \"{self.config['bridge']}\" tcp dport {self.host_api_port} "
+                         f"ether saddr != {self.config['mac']} drop")
+            lines.append('  }')
+        if rules:
+            lines.append('  chain prerouting {\n    type nat hook prerouting priority -100; policy accept;')
+            lines.extend(f'    {rule}' for rule in rules)
+            lines.append('  }')
+            # Connections from the host itself, including to loopback addresses
+            lines.append('  chain output {\n    type nat hook output priority -100; policy accept;')
+            lines.extend(f'    {rule}' for rule in rules)
+            lines.append('  }')
+        if rules and self.forwards_loopback():
+            lines.append('  chain postrouting {\n    type nat hook postrouting priority 100; policy accept;')
+            lines.append(f'    ip saddr 127.0.0.0/8 ip daddr {guest_ip} masquerade')
+            lines.append('  }')
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def describe(self) -> List[str]:
+        """Host-side commands setup() would run, for dry runs."""
+        if self.mode == 'passt':
+            return [' '.join(self.passt_command())]
+        if self.mode == 'tap':
+            tap = self.config['tap']
+            mq = ' multi_queue' if self.net_queues > 1 else ''
+            commands = [f'ip tuntap add dev {tap} mode tap{mq}',
+                        f"ip link set dev {tap} master {self.config['bridge']} up"]
+            if self.port_map and self.forwards_loopback():
+                commands.append(f'sysctl -w net.ipv4.conf.{self.config["bridge"]}.route_localnet=1')
+            if self.port_map or self.host_api_port:
+                commands.append(f'nft -f - <<EOF\n{self.nft_ruleset()}EOF')
+            return commands
+        return []
+
+    def setup(self) -> None:
+        if self.mode == 'passt':
+            self._start_passt()
+        elif self.mode == 'tap':
+            self._setup_tap()
+
+    def teardown(self) -> None:
+        stop_daemon(self.passt)
+        self.passt = None
+        if self.mode == 'tap':
+            self.teardown_filtering()
+            subprocess.run(['ip', 'link', 'del', self.config['tap']], capture_output=True)
+
+    def setup_filtering(self) -> None:
+        """Install the tap VM's nftables rules (port_map DNAT and the host API
+        filter), enabling route_localnet if a mapping listens on loopback."""
+        if self.port_map and self.forwards_loopback():
+            # DNAT of connections to 127.0.0.0/8 needs route_localnet on the
+            # egress side; teardown_filtering() restores the previous value
+            with open(self.route_localnet_path, 'r') as f:
+                previous = f.read().strip()
+            if previous != '1':
+                write_to_sysfs(self.route_localnet_path, '1')
+                self.saved_route_localnet = previous
+        if self.port_map or self.host_api_port:
+            subprocess.run(['nft', '-f', '-'], input=self.nft_ruleset(), text=True, check=True)
+
+    def teardown_filtering(self) -> None:
+        if self.port_map or self.host_api_port:
+            subprocess.run(['nft', 'delete', 'table', 'ip', self.nft_table],
+                           capture_output=True)
+        if self.saved_route_localnet is not None:
+            write_to_sysfs(self.route_localnet_path, self.saved_route_localnet)
+            self.saved_route_localnet = None
+
+    def _start_passt(self) -> None:
+        self.passt = spawn_socket_daemon(self.passt_command(), self.passt_socket, 'passt')
+
+    def _setup_tap(self) -> None:
+        tap = self.config['tap']
+        # Remove a tap left behind by a previous run
+        subprocess.run(['ip', 'link', 'del', tap], capture_output=True)
+        try:
+            cmd = ['ip', 'tuntap', 'add', 'dev', tap, 'mode', 'tap']
+            if self.net_queues > 1:
+                cmd.append('multi_queue')
+            subprocess.run(cmd, check=True)
+            subprocess.run(['ip', 'link', 'set', 'dev', tap, 'master', self.config['bridge'], 'up'],
+                           check=True)
+            self.setup_filtering()
+            if self.config.get('guest_ip'):
+                logger.info(f"Port mappings target {self.config['guest_ip']}; make sure the guest "
+                            f"gets that address, e.g. a DHCP reservation for {self.config['mac']}")
+        except (subprocess.CalledProcessError, OSError) as e:
+            self.teardown()
+            raise RuntimeError(f"Failed to set up tap networking: {e}")
+
+
+SHARED_FS_MODES = ('9p', 'virtiofs')
+# Where distributions install virtiofsd when it is not on PATH
+VIRTIOFSD_PATHS = ['/usr/libexec/virtiofsd', '/usr/lib/qemu/virtiofsd']
+
+
+class SharedFs:
+    """
+    Export of the VM's shared/ directory under the 'host-shared' mount tag.
+
+    The 9p export is always attached. In virtiofs mode a supervised
+    virtiofsd serves the same directory over vhost-user-fs with the same tag,
+    so guests that cannot mount virtiofs still find the 9p share. If
+    virtiofsd is not installed the export falls back to 9p only.
+    """
+
+    def __init__(self, vm_dir: str, mode: str = '9p', virtiofsd_path: str = 'virtiofsd'):
+        import shutil
+
+        if mode not in SHARED_FS_MODES:
+            raise ValueError(f"Invalid shared filesystem mode: {mode}")
+        self.shared_dir = os.path.join(os.path.abspath(vm_dir), 'shared')
+        self.socket_path = os.path.join(os.path.abspath(vm_dir), 'virtiofsd.sock')
+        self.mode = mode
+        self.virtiofsd = None
+        self.virtiofsd_path = None
+        if mode == 'virtiofs':
+            candidates = [virtiofsd_path] + VIRTIOFSD_PATHS
+            self.virtiofsd_path = next(filter(None, map(shutil.which, candidates)), None)
+            if not self.virtiofsd_path:
+                logger.warning("virtiofsd not found; exporting the shared directory over 9p only")
+                self.mode = '9p'
+
+    @property
+    def needs_shared_memory(self) -> bool:
+        """vhost-user-fs needs guest RAM in a shareable memory backend."""
+        return self.mode == 'virtiofs'
+
+    def virtiofsd_command(self) -> List[str]:
+        return [self.virtiofsd_path, '--socket-path', self.socket_path,
+                '--shared-dir', self.shared_dir, '--cache', 'auto']
+
+    def qemu_args(self) -> List[str]:
+        args = ['-virtfs', f'local,path={self.shared_dir},mount_tag=host-shared,readonly=off,security_model=mapped,id=virtfs0']
+        if self.mode == 'virtiofs':
+            args.extend([
+                '-chardev', f'socket,id=char-virtiofs0,path={self.socket_path}',
+                '-device', 'vhost-user-fs-pci,chardev=char-virtiofs0,tag=host-shared',
+            ])
+        return args
+
+    def describe(self) -> List[str]:
+        """Host-side commands setup() would run, for dry runs."""
+        if self.mode == 'virtiofs':
+            return [' '.join(self.virtiofsd_command())]
+        return []
+
+    def setup(self) -> None:
+        if self.mode == 'virtiofs':
+            self.virtiofsd = spawn_socket_daemon(
+                self.virtiofsd_command(), self.socket_path, 'virtiofsd')
+
+    def teardown(self) -> None:
+        stop_daemon(self.virtiofsd)
+        self.virtiofsd = None
+
+
 @dataclass
 class DstackConfig:
     """Configuration for dstack client."""
     docker_registry: Optional[str] = None
     default_image_name: str = ''
     qemu_path: str = 'qemu-system-x86_64'
+    virtiofsd_path: str = 'virtiofsd'
 
     @classmethod
     def load(cls) -> 'DstackConfig':
@@ -164,6 +649,7 @@ class DstackConfig:
         me.default_image_name = cfg_get(
             'image', 'default', cls.default_image_name)
         me.qemu_path = cfg_get('qemu', 'path', cls.qemu_path)
+        me.virtiofsd_path = cfg_get('virtiofsd', 'path', cls.virtiofsd_path)
         return me
 
 
@@ -297,6 +783,13 @@ class DstackManager:
                 "port_map": port_map,
                 "pin_numa": args.pin_numa,
                 "hugepages": args.hugepages,
+                "network": network_config(
+                    instance_id, mode=args.network, bridge=args.bridge,
+                    guest_ip=args.guest_ip, port_map=port_map),
+                "shared_fs": args.shared_fs,
+                "io": default_io_config(
+                    args.vcpus, disk_queues=args.disk_queues, net_queues=args.net_queues,
+                    iothreads=not args.no_iothreads, cache=args.disk_cache, aio=args.disk_aio),
                 "created_at_ms": int(datetime.now().timestamp() * 1000)
             }
             with open(os.path.join(work_dir, 'vm-manifest.json'), 'w') as f:
@@ -370,12 +863,16 @@ class DstackManager:
                 raise ValueError(
                     f"Invalid GPU attach mode: {gpus['attach_mode']}")
 
-    def run_instance(self, vm_dir: str, host_port: int, imgdir: Optional[str] = None, dry_run: bool = False) -> None:
+    def run_instance(self, vm_dir: str, host_port: int, imgdir: Optional[str] = None, dry_run: bool = False,
+                     network: Optional[VmNetwork] = None, bind_vfio: bool = False) -> None:
         """Run a VM instance from the specified directory.
 
         Args:
             vm_dir: Directory containing the VM configuration
             dry_run: Whether to run in dry run mode
+            network: Network backend (default: built from the manifest)
+            bind_vfio: Bind the VM's GPUs and NVSwitches to vfio-pci by slot
+                before starting and release them when the VM exits
         """
 
         manifest_path = os.path.join(vm_dir, 'vm-manifest.json')
@@ -403,14 +900,16 @@ class DstackManager:
 
         os_image_hash = open(os.path.join(
             image_path, 'digest.txt'), 'r').read().strip()
-        gen_vm_config(vm_dir, host_port, manifest, os_image_hash)
+        network = network or VmNetwork(vm_dir, manifest)
+        network.host_api_port = host_port
+        gen_vm_config(vm_dir, host_port, manifest, os_image_hash,
+                      host_address=network.host_address())
 
         mem_gb = manifest['memory'] // 1024
         vcpu_count = manifest['vcpu']
         disk_size = manifest['disk_size']
 
         vda = os.path.join(vm_dir, 'hda.img')
-        config_dir = os.path.join(vm_dir, 'shared')
 
         # Create disk if it doesn't exist
         if not os.path.exists(vda):
@@ -418,36 +917,23 @@ class DstackManager:
                            vda, f"{disk_size}G"], check=True)
 
         cid = random.randint(1, 10000) + 3
+        io_cfg = manifest.get('io')
 
         # Prepare QEMU command
         cmd_args = []
         rootfs_image = os.path.join(image_path, img_metadata['rootfs'])
         if rootfs_image.endswith('.img.verity'):
-            cmd_args.extend([
-                '-drive', f'file={rootfs_image},if=none,id=virtio-disk0,format=raw',
-                '-device', 'virtio-blk-pci,drive=virtio-disk0',
-            ])
+            cmd_args.extend(virtio_disk_args(
+                0, f'file={rootfs_image},format=raw', io_cfg))
         elif rootfs_image.endswith('.img'):
             cmd_args.extend(['-cdrom', rootfs_image])
         else:
             raise ValueError(
                 f"Unsupported rootfs image format: {rootfs_image}")
-        cmd_args.extend(['-drive', f'file={vda},if=none,id=virtio-disk1'])
-        cmd_args.extend(['-device', 'virtio-blk-pci,drive=virtio-disk1'])
+        cmd_args.extend(virtio_disk_args(1, f'file={vda}', io_cfg))
 
         # Add network configuration
-        port_args = []
-        for port_map in manifest.get('port_map', []):
-            protocol = port_map.get('protocol', 'tcp')
-            bind_address = port_map.get('address', '127.0.0.1')
-            host_port = port_map['from']
-            vm_port = port_map['to']
-            port_args.append(
-                f"hostfwd={protocol}:{bind_address}:{host_port}-:{vm_port}")
-        cmd_args.extend([
-            '-device', 'virtio-net-pci,netdev=nic0_td',
-            '-netdev', f"user,id=nic0_td{','+','.join(port_args) if len(port_args) > 0 else ''}"
-        ])
+        cmd_args.extend(network.qemu_args())
 
         # Handle GPUs
         gpus_cfg = manifest.get('gpus') or {}
@@ -506,6 +992,13 @@ class DstackManager:
                     '-device', f'vfio-pci,host={slot},bus=pci.{dev_num},iommufd=iommufd0',
                 ])
                 dev_num += 1
+        shared_fs = SharedFs(vm_dir, manifest.get('shared_fs', '9p'), self.config.virtiofsd_path)
+        machine = 'q35,kernel_irqchip=split,confidential-guest-support=tdx,hpet=off'
+        # The hugepage backends are already shared; otherwise back RAM with a memfd
+        if shared_fs.needs_shared_memory and not hugepages:
+            machine += ',memory-backend=mem0'
+            cmd_args.extend(['-object', f'memory-backend-memfd,id=mem0,size={mem_gb}G,share=on'])
+
         # Add kernel command line
         cmd_args.extend(['-append', img_metadata['cmdline']])
 
@@ -515,7 +1008,7 @@ class DstackManager:
             '-m', f'{mem_gb}G',
             '-smp', str(vcpu_count),
             '-cpu', 'host',
-            '-machine', 'q35,kernel_irqchip=split,confidential-guest-support=tdx,hpet=off',
+            '-machine', machine,
             '-object', 'tdx-guest,id=tdx',
             '-nographic',
             '-nodefaults',
@@ -524,7 +1017,7 @@ class DstackManager:
             '-kernel', os.path.join(image_path, img_metadata['kernel']),
             '-initrd', os.path.join(image_path, img_metadata['initrd']),
             '-bios', os.path.join(image_path, img_metadata['bios']),
-            '-virtfs', f'local,path={config_dir},mount_tag=host-shared,readonly=off,security_model=mapped,id=virtfs0',
+        ] + shared_fs.qemu_args() + [
             '-device', f'vhost-vsock-pci,guest-cid={cid}',
         ]
 
@@ -535,17 +1028,36 @@ class DstackManager:
             else:
                 numa_node = 0
             cpus = open(
-                f'/sys/devices/system/node/node{numa_node}/cpulist').read().strip()
+                f'{SYSFS_ROOT}/devices/system/node/node{numa_node}/cpulist').read().strip()
             base_args = ['taskset', '-c', cpus] + base_args
         cmd = base_args + cmd_args
         print(" \n".join(cmd))
+        vfio_slots = manifest_vfio_slots(manifest) if bind_vfio else []
         if dry_run:
+            setup = network.describe() + shared_fs.describe()
+            if vfio_slots:
+                setup.append(f"bind to vfio-pci: {' '.join(vfio_slots)}")
+            if setup:
+                print("Host setup:")
+                print("\n".join(setup))
             return
         # Run the command
+        bound = []
         try:
+            if vfio_slots:
+                # Devices that were on vfio-pci before this run stay bound afterwards
+                previous = bind_slots_to_vfio(vfio_slots)
+                bound = [slot for slot, driver in previous.items() if driver != 'vfio-pci']
+            network.setup()
+            shared_fs.setup()
             subprocess.run(cmd, check=True)
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Failed to start VM: {e}")
+        finally:
+            shared_fs.teardown()
+            network.teardown()
+            if bound:
+                bind_slots_to_vfio(bound, release=True)
 
 
 def numa_node_of_device(pci_slot):
@@ -562,7 +1074,7 @@ def numa_node_of_device(pci_slot):
     if not pci_slot.startswith("0000:"):
         pci_slot = f"0000:{pci_slot}"
     # Try to read NUMA node from sysfs
-    numa_path = f"/sys/bus/pci/devices/{pci_slot}/numa_node"
+    numa_path = f"{SYSFS_ROOT}/bus/pci/devices/{pci_slot}/numa_node"
 
     with open(numa_path, 'r') as f:
         numa_node = int(f.read().strip())
@@ -629,22 +1141,33 @@ def list_available_gpus() -> None:
         logger.warning(f"Could not list GPU devices: {str(e)}")
 
 
-def start_server(dir: str, kp_port: int):
+def start_server(dir: str, kp_port: int, address: str = 'localhost'):
+    # The HTTP stack is only needed by 'run'; keep it off the startup path
+    import host_api
+    import threading
+
     config = host_api.ServerConfig(
         vm_dir=dir, kp_address="127.0.0.1", kp_port=kp_port)
-    api, host_port = host_api.create_http_server(config)
-    print(f"Starting HTTP server on localhost:{host_port}")
+    api, host_port = host_api.create_http_server(config, address)
+    print(f"Starting HTTP server on {address}:{host_port}")
     thread = threading.Thread(target=api.serve_forever, daemon=True)
     thread.host_port = host_port
     thread.start()
     return thread
 
 
-def tag_vfio():
+def tag_vfio(slots=None, release=False):
     """
     Tag NVIDIA GPUs and NVSwitches for VFIO passthrough.
     Detects NVIDIA devices and configures them for VFIO passthrough.
+
+    With slots, only those devices are bound (or released) individually
+    through driver_override instead of claiming every device by ID.
     """
+    if slots:
+        bind_slots_to_vfio(slots, release=release)
+        return
+
     logging.info("==> Detecting NVIDIA GPUs and NVSwitches")
 
     try:
@@ -780,6 +1303,170 @@ def tag_device_for_vfio(dev_id, device_type):
             logging.error(f"Failed to tag {device_type}: {e}")
 
 
+# Parallel sysfs unbind/bind workers; unbinding the nvidia driver takes seconds per device
+VFIO_BIND_WORKERS = 8
+
+
+def pci_device_driver(pci_slot):
+    """Return the name of the driver bound to a PCI device, or None."""
+    driver_link = f"{SYSFS_ROOT}/bus/pci/devices/{pci_slot}/driver"
+    if not os.path.islink(driver_link):
+        return None
+    return os.path.basename(os.readlink(driver_link))
+
+
+def bind_slot_to_vfio(pci_slot):
+    """
+    Bind one PCI device to vfio-pci via driver_override.
+
+    Only this device is affected; other devices with the same vendor and
+    device ID keep their drivers. A device already bound to vfio-pci is
+    left untouched. On failure driver_override is cleared again and the
+    device is reprobed, so it is not left claimable by vfio-pci.
+
+    Returns:
+        str: The driver the device was bound to before, or None
+    """
+    if not pci_slot.startswith("0000:"):
+        pci_slot = f"0000:{pci_slot}"
+    dev_dir = f"{SYSFS_ROOT}/bus/pci/devices/{pci_slot}"
+    if not os.path.isdir(dev_dir):
+        raise RuntimeError(f"PCI device {pci_slot} not found")
+
+    driver = pci_device_driver(pci_slot)
+    if driver == 'vfio-pci':
+        logging.info(f"{pci_slot} is already bound to vfio-pci")
+        return driver
+
+    write_to_sysfs(f"{dev_dir}/driver_override", 'vfio-pci')
+    try:
+        if driver:
+            logging.info(f"Unbinding {pci_slot} from {driver}")
+            write_to_sysfs(f"{dev_dir}/driver/unbind", pci_slot)
+        write_to_sysfs(f"{SYSFS_ROOT}/bus/pci/drivers_probe", pci_slot)
+        if pci_device_driver(pci_slot) != 'vfio-pci':
+            raise RuntimeError(f"Failed to bind {pci_slot} to vfio-pci")
+    except (OSError, RuntimeError):
+        write_to_sysfs(f"{dev_dir}/driver_override", '\n')
+        if pci_device_driver(pci_slot) is None:
+            write_to_sysfs(f"{SYSFS_ROOT}/bus/pci/drivers_probe", pci_slot)
+        raise
+    logging.info(f"Bound {pci_slot} to vfio-pci")
+    return driver
+
+
+def release_slot_from_vfio(pci_slot):
+    """
+    Undo bind_slot_to_vfio: unbind from vfio-pci, clear driver_override and
+    let the kernel probe the default driver again. Devices not bound to
+    vfio-pci are left alone.
+    """
+    if not pci_slot.startswith("0000:"):
+        pci_slot = f"0000:{pci_slot}"
+    dev_dir = f"{SYSFS_ROOT}/bus/pci/devices/{pci_slot}"
+    if pci_device_driver(pci_slot) != 'vfio-pci':
+        return
+    write_to_sysfs(f"{dev_dir}/driver/unbind", pci_slot)
+    write_to_sysfs(f"{dev_dir}/driver_override", '\n')
+    write_to_sysfs(f"{SYSFS_ROOT}/bus/pci/drivers_probe", pci_slot)
+    logging.info(f"Released {pci_slot} (now {pci_device_driver(pci_slot) or 'unbound'})")
+
+
+def bind_slots_to_vfio(slots, release=False):
+    """
+    Bind (or release) a set of PCI devices in parallel.
+
+    Returns:
+        dict: slot -> result of bind_slot_to_vfio/release_slot_from_vfio
+
+    Raises:
+        RuntimeError: If any device fails; the others are still processed.
+            When binding, devices this call moved to vfio-pci are released
+            again before raising, so a failed bind leaves no device behind.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not slots:
+        return {}
+    if not release:
+        load_vfio_modules()
+    action = release_slot_from_vfio if release else bind_slot_to_vfio
+    results = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=min(len(slots), VFIO_BIND_WORKERS)) as pool:
+        futures = {slot: pool.submit(action, slot) for slot in slots}
+        for slot, future in futures.items():
+            try:
+                results[slot] = future.result()
+            except (OSError, RuntimeError) as e:
+                errors.append(f"{slot}: {e}")
+    if errors and not release:
+        rollback = [slot for slot, driver in results.items() if driver != 'vfio-pci']
+        try:
+            bind_slots_to_vfio(rollback, release=True)
+        except RuntimeError as e:
+            errors.append(str(e))
+    if errors:
+        raise RuntimeError("VFIO {} failed for {}".format(
+            'release' if release else 'binding', '; '.join(errors)))
+    return results
+
+
+def test_bind_slots_to_vfio_rolls_back(tmp_path, monkeypatch):
+    import pytest
+
+    devices = tmp_path / 'bus/pci/devices'
+    drivers = tmp_path / 'bus/pci/drivers'
+    broken = '0000:02:00.0'
+
+    def set_driver(slot, driver):
+        link = devices / slot / 'driver'
+        if link.is_symlink():
+            link.unlink()
+        if driver:
+            (drivers / driver).mkdir(parents=True, exist_ok=True)
+            link.symlink_to(drivers / driver)
+
+    def fake_kernel(path, value):
+        # Emulate the sysfs files bind_slot_to_vfio and release_slot_from_vfio write
+        path = Path(path)
+        if path.name == 'driver_override':
+            path.write_text(value.strip())
+        elif path.name == 'unbind':
+            set_driver(value, None)
+        elif path.name == 'drivers_probe':
+            override = (devices / value / 'driver_override').read_text()
+            if override == 'vfio-pci' and value != broken:
+                set_driver(value, 'vfio-pci')
+            elif not override:
+                set_driver(value, 'nvidia')
+
+    for slot, driver in (('0000:01:00.0', 'nvidia'), (broken, 'nvidia'),
+                         ('0000:03:00.0', 'vfio-pci')):
+        (devices / slot).mkdir(parents=True)
+        (devices / slot / 'driver_override').write_text('')
+        set_driver(slot, driver)
+    monkeypatch.setitem(globals(), 'SYSFS_ROOT', str(tmp_path))
+    monkeypatch.setitem(globals(), 'write_to_sysfs', fake_kernel)
+    monkeypatch.setitem(globals(), 'load_vfio_modules', lambda: None)
+
+    with pytest.raises(RuntimeError, match=broken):
+        bind_slots_to_vfio(['0000:01:00.0', broken, '0000:03:00.0'])
+    assert pci_device_driver('0000:01:00.0') == 'nvidia'
+    assert pci_device_driver(broken) == 'nvidia'
+    assert (devices / broken / 'driver_override').read_text() == ''
+    assert pci_device_driver('0000:03:00.0') == 'vfio-pci'
+
+    assert bind_slots_to_vfio(['0000:01:00.0']) == {'0000:01:00.0': 'nvidia'}
+    assert pci_device_driver('0000:01:00.0') == 'vfio-pci'
+
+
+def manifest_vfio_slots(manifest):
+    """PCI slots of the GPUs and NVSwitches a VM manifest passes through."""
+    gpus_cfg = manifest.get('gpus') or {}
+    return [dev['slot'] for dev in (gpus_cfg.get('gpus') or []) + (gpus_cfg.get('bridges') or [])]
+
+
 def write_to_sysfs(path, value):
     """
     Write a value directly to a sysfs file.
@@ -822,6 +1509,26 @@ def main():
         '--pin-numa', action='store_true', help='Pin vCPUs to NUMA node')
     setup_parser.add_argument(
         '--hugepages', action='store_true', help='Enable hugepages')
+    setup_parser.add_argument('--network', type=str, choices=NETWORK_MODES, default='user',
+                              help='Network backend: user (slirp), tap (bridge + vhost-net) or passt')
+    setup_parser.add_argument('--bridge', type=str,
+                              help=f'Host bridge for tap networking (default: {DEFAULT_BRIDGE})')
+    setup_parser.add_argument('--guest-ip', type=str,
+                              help='Guest IPv4 address on the bridge, the DNAT target for port mappings '
+                                   'in tap mode; it is not assigned automatically, so reserve it for the '
+                                   'VM\'s MAC in the bridge\'s DHCP server')
+    setup_parser.add_argument('--shared-fs', type=str, choices=SHARED_FS_MODES, default='9p',
+                              help='Transport for the host-shared directory: 9p, or virtiofs with 9p fallback')
+    setup_parser.add_argument('--disk-queues', type=int,
+                              help=f'virtio-blk queues per disk (default: vCPUs, max {MAX_DISK_QUEUES})')
+    setup_parser.add_argument('--net-queues', type=int,
+                              help=f'virtio-net queue pairs (default: vCPUs, max {MAX_NET_QUEUES})')
+    setup_parser.add_argument('--no-iothreads', action='store_true',
+                              help='Do not give each disk its own iothread')
+    setup_parser.add_argument('--disk-cache', type=str, default='none',
+                              help='QEMU drive cache mode (default: none)')
+    setup_parser.add_argument('--disk-aio', type=str, default='io_uring',
+                              help='QEMU drive aio backend (default: io_uring)')
 
     # Start command
     start_parser = subparsers.add_parser('run', help='Start an instance')
@@ -831,13 +1538,22 @@ def main():
         '--kp-port', type=int, default=3443, help='The key provider listening port')
     start_parser.add_argument(
         '--dry-run', action='store_true', help='Run in dry run mode')
+    start_parser.add_argument(
+        '--bind-vfio', action='store_true',
+        help='Bind the VM\'s GPUs and NVSwitches to vfio-pci by slot and release them on exit')
 
     # List Gpus command
     subparsers.add_parser('lsgpu', help='List available GPUs')
 
     # Tag VFIO command
-    subparsers.add_parser(
+    vfio_parser = subparsers.add_parser(
         'tag-vfio', help='Tag NVIDIA GPUs and NVSwitches for VFIO passthrough')
+    vfio_parser.add_argument('--slot', action='append', type=str,
+                             help='Bind only this PCI slot (repeatable)')
+    vfio_parser.add_argument('--vm', type=str,
+                             help='Bind only the GPUs and NVSwitches of this work directory')
+    vfio_parser.add_argument('--release', action='store_true',
+                             help='Release the selected slots back to their default drivers')
 
     # Run the host server only
     serve_parser = subparsers.add_parser(
@@ -853,17 +1569,41 @@ def main():
         manager.setup_instance(args)
     elif args.command == 'run':
         manager = DstackManager()
-        thread = start_server(args.dir, args.kp_port)
+        network = VmNetwork.from_vm_dir(args.dir)
+        thread = start_server(args.dir, args.kp_port, network.host_api_bind_address())
         manager.run_instance(args.dir, thread.host_port,
-                             imgdir=args.imgdir, dry_run=args.dry_run)
+                             imgdir=args.imgdir, dry_run=args.dry_run, network=network,
+                             bind_vfio=args.bind_vfio)
     elif args.command == 'lsgpu':
         list_available_gpus()
     elif args.command == 'tag-vfio':
-        tag_vfio()
+        slots = list(args.slot or [])
+        if args.vm:
+            with open(os.path.join(args.vm, 'vm-manifest.json'), 'r') as f:
+                slots.extend(manifest_vfio_slots(json.load(f)))
+        if args.release and not slots:
+            parser.error('--release requires --slot or --vm')
+        if args.vm and not slots:
+            logging.info(f"No GPUs or NVSwitches in {args.vm}")
+        else:
+            tag_vfio(slots, release=args.release)
     elif args.command == 'serve':
-        thread = start_server(args.dir, args.kp_port)
-        gen_vm_config(args.dir, thread.host_port)
-        thread.join()
+        network = VmNetwork.from_vm_dir(args.dir)
+        thread = start_server(args.dir, args.kp_port, network.host_api_bind_address())
+        gen_vm_config(args.dir, thread.host_port, host_address=network.host_address())
+        if network.mode == 'tap':
+            # The host API listens on the bridge; keep other guests off it
+            network.host_api_port = thread.host_port
+            try:
+                network.setup_filtering()
+            except (subprocess.CalledProcessError, OSError) as e:
+                network.teardown_filtering()
+                raise RuntimeError(f"Failed to install the host API filter: {e}")
+        try:
+            thread.join()
+        finally:
+            if network.mode == 'tap':
+                network.teardown_filtering()
     else:
         parser.print_help()
 
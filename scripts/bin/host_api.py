@@ -104,11 +104,11 @@ class QuoteHandler(BaseHTTPRequestHandler):
         self.wfile.write(data)
 
 
-def create_http_server(config: ServerConfig):
+def create_http_server(config: ServerConfig, address: str = 'localhost'):
     def handler(*args):
         QuoteHandler(config, *args)
 
-    server = HTTPServer(('localhost', 0), handler)
+    server = HTTPServer((address, 0), handler)
     chosen_port = server.server_port
     return server, chosen_port
 
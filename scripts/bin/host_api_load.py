@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+"""
+Boot-storm load generator for the host API.
+
+Starts a local fake key provider (see host_api_testing.FakeKeyProvider) and one or
+more host_api servers, then has N simulated guests run their boot-time
+calls concurrently: GetSealingKey with a TDX-sized quote followed by a
+Notify carrying instance.info. By default every guest gets its own host
+API server, as with `dstack.py run`, and all of them share one key
+provider.
+
+Reports throughput plus per-endpoint p50/p99 latency and error rates.
+
+Usage:
+    host_api_load.py [--guests 32] [--servers N] [--rounds 1]
+                     [--kp-latency-ms 0] [--kp-failure-rate 0] [--json FILE]
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from host_api_testing import FakeKeyProvider, start_host_api
+
+# Typical size of a TDX v4 quote including the PCK certificate chain
+DEFAULT_QUOTE_SIZE = 5000
+
+
+@dataclass
+class EndpointStats:
+    latencies: List[float] = field(default_factory=list)
+    errors: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, latency: float, error: str = "") -> None:
+        if error:
+            self.errors[error] = self.errors.get(error, 0) + 1
+        else:
+            self.latencies.append(latency)
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies) + sum(self.errors.values())
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def post(port: int, path: str, body: bytes, timeout: float) -> Tuple[float, str]:
+    """POST body to the host API and return (latency, error kind or '')."""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        error = "" if response.status == 200 else f"http_{response.status}"
+    except (OSError, http.client.HTTPException) as e:
+        error = type(e).__name__
+    finally:
+        conn.close()
+    return time.perf_counter() - start, error
+
+
+def run_guest(index: int, port: int, rounds: int, quote_size: int, timeout: float,
+              start_at: float, stats: Dict[str, EndpointStats], lock: threading.Lock) -> None:
+    """Simulate the boot-time host API calls of one guest."""
+    delay = start_at - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+    for _ in range(rounds):
+        quote = json.dumps({"quote": os.urandom(quote_size).hex()}).encode()
+        latency, error = post(port, "/api/GetSealingKey", quote, timeout)
+        with lock:
+            stats["GetSealingKey"].record(latency, error)
+
+        info = json.dumps({"instance_id": f"{index:040x}", "app_id": "0" * 40,
+                           "ip": f"10.0.{index // 256}.{index % 256}"})
+        notify = json.dumps({"event": "instance.info", "payload": info}).encode()
+        latency, error = post(port, "/api/Notify", notify, timeout)
+        with lock:
+            stats["Notify"].record(latency, error)
+
+
+def run_load(guests: int, servers: int, rounds: int = 1, quote_size: int = DEFAULT_QUOTE_SIZE,
+             kp_latency: float = 0.0, kp_failure_rate: float = 0.0, ramp: float = 0.0,
+             timeout: float = 30.0) -> dict:
+    """Run the boot storm and return a JSON-serializable report."""
+    stats = {"GetSealingKey": EndpointStats(), "Notify": EndpointStats()}
+    lock = threading.Lock()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        kp = FakeKeyProvider(delay=kp_latency, failure_rate=kp_failure_rate).start()
+        apis = []
+        try:
+            for i in range(servers):
+                vm_dir = os.path.join(tmp, f"vm{i}")
+                os.makedirs(os.path.join(vm_dir, "shared"))
+                apis.append(start_host_api(vm_dir, kp.port))
+
+            # host_api logs every request and prints tracebacks for failed
+            # key provider calls; keep that out of the report
+            with contextlib.redirect_stderr(io.StringIO()):
+                start = time.perf_counter() + 0.1
+                threads = [
+                    threading.Thread(target=run_guest, args=(
+                        i, apis[i % servers][1], rounds, quote_size, timeout,
+                        start + (ramp * i / guests if ramp else 0), stats, lock))
+                    for i in range(guests)
+                ]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                elapsed = time.perf_counter() - start
+        finally:
+            for server, _ in apis:
+                server.shutdown()
+            kp.shutdown()
+
+    report = {
+        "guests": guests,
+        "servers": servers,
+        "rounds": rounds,
+        "quote_size": quote_size,
+        "kp_latency_ms": kp_latency * 1000,
+        "kp_failure_rate": kp_failure_rate,
+        "kp_requests": kp.requests,
+        "kp_dropped": kp.failures,
+        "elapsed_s": elapsed,
+        "endpoints": {},
+    }
+    total = 0
+    for name, s in stats.items():
+        latencies = sorted(s.latencies)
+        errors = sum(s.errors.values())
+        total += s.count
+        report["endpoints"][name] = {
+            "requests": s.count,
+            "errors": s.errors,
+            "error_rate": errors / s.count if s.count else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        }
+    report["requests"] = total
+    report["throughput_rps"] = total / elapsed if elapsed > 0 else 0.0
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['guests']} guests on {report['servers']} host API server(s), "
+          f"{report['rounds']} round(s), {report['quote_size']} byte quotes")
+    print(f"KP latency {report['kp_latency_ms']:.1f} ms, failure rate "
+          f"{report['kp_failure_rate']:.1%} ({report['kp_dropped']}/{report['kp_requests']} dropped)")
+    print(f"{report['requests']} requests in {report['elapsed_s']:.3f} s "
+          f"({report['throughput_rps']:.1f} req/s)")
+    print(f"{'ENDPOINT':16} {'REQUESTS':>8} {'ERR%':>8} {'P50':>10} {'P99':>10} {'MAX':>10}")
+    for name, e in report["endpoints"].items():
+        print(f"{name:16} {e['requests']:>8} {e['error_rate']:>7.1%} "
+              f"{e['p50_ms']:>7.2f} ms {e['p99_ms']:>7.2f} ms {e['max_ms']:>7.2f} ms")
+        for kind, count in sorted(e["errors"].items()):
+            print(f"  {kind}: {count}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Simulate guests booting against the host API')
+    parser.add_argument('--guests', '-n', type=int, default=32, help='Number of simulated guests')
+    parser.add_argument('--servers', type=int,
+                        help='Number of host API servers (default: one per guest)')
+    parser.add_argument('--rounds', type=int, default=1, help='Boot sequences per guest')
+    parser.add_argument('--quote-size', type=int, default=DEFAULT_QUOTE_SIZE,
+                        help=f'Quote size in bytes (default: {DEFAULT_QUOTE_SIZE})')
+    parser.add_argument('--kp-latency-ms', type=float, default=0.0,
+                        help='Key provider response latency in milliseconds')
+    parser.add_argument('--kp-failure-rate', type=float, default=0.0,
+                        help='Fraction of key provider requests to drop (0-1)')
+    parser.add_argument('--ramp', type=float, default=0.0,
+                        help='Spread guest start times over this many seconds')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='Per-request client timeout in seconds')
+    parser.add_argument('--json', type=str, dest='json_file',
+                        help='Write the JSON report to this file ("-" for stdout)')
+    args = parser.parse_args()
+
+    if args.guests < 1 or (args.servers is not None and args.servers < 1):
+        parser.error("--guests and --servers must be positive")
+    if not 0 <= args.kp_failure_rate <= 1:
+        parser.error("--kp-failure-rate must be between 0 and 1")
+
+    report = run_load(args.guests, min(args.servers or args.guests, args.guests),
+                      rounds=args.rounds, quote_size=args.quote_size,
+                      kp_latency=args.kp_latency_ms / 1000,
+                      kp_failure_rate=args.kp_failure_rate,
+                      ramp=args.ramp, timeout=args.timeout)
+
+    if args.json_file == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    if args.json_file:
+        with open(args.json_file, 'w') as f:
+            json.dump(report, f, indent=2)
+    print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Test doubles for exercising the host API locally.
+
+FakeKeyProvider answers host_api.get_key requests, and start_host_api
+runs a host API server against it. Used by bench.py and host_api_load.py.
+"""
+
+import json
+import os
+import random
+import socketserver
+import struct
+import threading
+import time
+from typing import Optional, Tuple
+
+
+class FakeKeyProvider(socketserver.ThreadingTCPServer):
+    """Key provider speaking the length-prefixed JSON protocol used by host_api.get_key.
+
+    Every request gets a fixed-size encrypted key and provider quote back
+    after `delay` seconds. A `failure_rate` fraction of requests is dropped
+    by closing the connection without a reply.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, key_size: int = 32, quote_size: int = 5000, delay: float = 0.0,
+                 failure_rate: float = 0.0):
+        self.key = list(os.urandom(key_size))
+        self.provider_quote = list(os.urandom(quote_size))
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), FakeKeyProviderHandler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeKeyProvider":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FakeKeyProviderHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        header = self._recv_exact(4)
+        if header is None:
+            return
+        length = struct.unpack(">I", header)[0]
+        payload = self._recv_exact(length)
+        if payload is None:
+            return
+        json.loads(payload)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        fail = self.server.failure_rate and random.random() < self.server.failure_rate
+        with self.server._lock:
+            self.server.requests += 1
+            if fail:
+                self.server.failures += 1
+        if fail:
+            return
+        response = json.dumps({"encrypted_key": self.server.key,
+                               "provider_quote": self.server.provider_quote}).encode()
+        self.request.sendall(struct.pack(">I", len(response)) + response)
+
+    def _recv_exact(self, n: int) -> Optional[bytes]:
+        data = b""
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+
+def start_host_api(vm_dir: str, kp_port: int) -> Tuple[object, int]:
+    """Start the host API HTTP server in a background thread."""
+    import host_api
+
+    config = host_api.ServerConfig(vm_dir=vm_dir, kp_address="127.0.0.1", kp_port=kp_port)
+    server, port = host_api.create_http_server(config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, port
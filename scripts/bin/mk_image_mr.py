@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Build a measurement bundle (mr_<digest>.tar.gz) from a release tarball.
+
+The source .tar.gz is read as a stream from a local file or URL. rootfs*
+members are skipped without being written anywhere, the remaining files are
+flattened to their basenames and written to the output archive with
+deterministic headers in the same pass. digest.txt is picked up as it goes
+past and names the output file once the stream is complete.
+"""
+
+import argparse
+import gzip
+import io
+import os
+import re
+import sys
+import tarfile
+import tempfile
+import urllib.request
+from typing import BinaryIO, Optional
+
+COPY_BUFSIZE = 1024 * 1024
+
+
+def open_source(source: str) -> BinaryIO:
+    """Open a local file or an http(s) URL for streaming reads."""
+    if re.match(r'^https?://', source):
+        return urllib.request.urlopen(source)
+    return open(source, 'rb')
+
+
+def normalized_info(member: tarfile.TarInfo, name: str) -> tarfile.TarInfo:
+    """Return a header with only the name, size and permission bits kept."""
+    info = tarfile.TarInfo(name)
+    info.size = member.size
+    info.mode = member.mode & 0o755
+    info.mtime = 0
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    return info
+
+
+def build_bundle(source: str, output_dir: str = ".") -> str:
+    """Stream source into mr_<digest>.tar.gz inside output_dir.
+
+    Returns:
+        Path of the created bundle
+    """
+    # A unique partial file per run, so concurrent runs in one directory
+    # cannot write into each other's download
+    fd, partial_path = tempfile.mkstemp(prefix=".mr_bundle.", suffix=".tar.gz.part",
+                                        dir=output_dir)
+    digest: Optional[str] = None
+    count = 0
+
+    try:
+        with open_source(source) as src, os.fdopen(fd, 'wb') as raw_out:
+            with gzip.GzipFile(filename="", mode='wb', fileobj=raw_out, mtime=0) as gz_out:
+                with tarfile.open(fileobj=src, mode='r|gz', bufsize=COPY_BUFSIZE) as tar_in, \
+                        tarfile.open(fileobj=gz_out, mode='w|', format=tarfile.GNU_FORMAT,
+                                     bufsize=COPY_BUFSIZE) as tar_out:
+                    for member in tar_in:
+                        if not member.isfile():
+                            continue
+                        name = os.path.basename(member.name)
+                        if not name or name.startswith("rootfs"):
+                            continue
+                        fileobj = tar_in.extractfile(member)
+                        if name == "digest.txt":
+                            data = fileobj.read()
+                            digest = re.sub(r'[^a-zA-Z0-9]', '', data.decode(errors='replace'))
+                            fileobj = io.BytesIO(data)
+                        tar_out.addfile(normalized_info(member, name), fileobj)
+                        count += 1
+                        print(f"Added {name}", file=sys.stderr)
+
+        if not digest:
+            raise ValueError(f"digest.txt not found in {source}")
+
+        output_path = os.path.join(output_dir, f"mr_{digest}.tar.gz")
+        # mkstemp creates the file 0600; bundles are meant to be shared
+        os.chmod(partial_path, 0o644)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        try:
+            os.unlink(partial_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    print(f"Archive contains {count} files with flattened structure", file=sys.stderr)
+    return output_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Create a flattened measurement bundle (without rootfs) from a release tarball'
+    )
+    parser.add_argument('source', help='URL or path of the release .tar.gz')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='Directory to write mr_<digest>.tar.gz to (default: current directory)')
+    args = parser.parse_args()
+
+    try:
+        print(build_bundle(args.source, args.output_dir))
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+
+"""
+Assemble dstack disk images without sgdisk, mkfs.vfat, mtools or dd.
+
+Two layouts are supported:
+
+  rootfs  GPT disk with a single 'dstack-rootfs' partition
+          (rootfs.img.parted.verity)
+  uki     GPT disk with a FAT32 EFI System Partition holding the UKI as
+          EFI/BOOT/BOOTX64.EFI, followed by the rootfs partition (disk.raw)
+
+GPT structures and the FAT32 filesystem are written directly, partition
+contents are placed with copy_file_range (which reflinks where the
+filesystem supports it) and holes in the inputs are preserved. GUIDs are
+derived from the content being packed (the sha256 of the UKI and of the
+rootfs, or a --rootfs-seed such as the dm-verity root hash that already
+identifies it), the FAT volume ID from the UKI and timestamps are fixed, so
+the output is byte-for-byte reproducible and images with different contents
+get different GUIDs.
+"""
+
+import argparse
+import errno
+import hashlib
+import os
+import struct
+import sys
+import uuid
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+SECTOR_SIZE = 512
+ALIGN = 1024 * 1024
+EFI_SIZE = 256 * 1024 * 1024
+COPY_CHUNK = 8 * 1024 * 1024
+
+GPT_ENTRY_COUNT = 128
+GPT_ENTRY_SIZE = 128
+GPT_LINUX_FS_TYPE = uuid.UUID("0fc63daf-8483-4772-8e79-3d69d8477de4")
+GPT_EFI_SYSTEM_TYPE = uuid.UUID("c12a7328-f81f-11d2-ba4b-00a0c93ec93b")
+
+FAT_RESERVED_SECTORS = 32
+FAT_COUNT = 2
+FAT_EOC = 0x0FFFFFFF
+FAT_VOLUME_LABEL = "DSTACKEFI"
+# 1980-01-01 00:00:00, the FAT epoch
+FAT_DATE = (0 << 9) | (1 << 5) | 1
+FAT_TIME = 0
+
+
+def align_up(value: int, align: int) -> int:
+    return (value + align - 1) // align * align
+
+
+@dataclass
+class Partition:
+    """A GPT partition; start and size are in bytes."""
+    name: str
+    type_guid: uuid.UUID
+    start: int
+    size: int
+
+
+def write_gpt(fd: int, disk_size: int, partitions: List[Partition], seed: str) -> None:
+    """Write a protective MBR and primary/backup GPT for the given partitions.
+
+    The disk and partition GUIDs are derived from seed, which should identify
+    the packed contents.
+    """
+    total_sectors = disk_size // SECTOR_SIZE
+    entry_sectors = GPT_ENTRY_COUNT * GPT_ENTRY_SIZE // SECTOR_SIZE
+    first_usable = 2 + entry_sectors
+    last_usable = total_sectors - 2 - entry_sectors
+
+    disk_guid = uuid.uuid5(uuid.NAMESPACE_URL, f"dstack-disk:{seed}")
+
+    entries = bytearray(GPT_ENTRY_COUNT * GPT_ENTRY_SIZE)
+    for i, part in enumerate(partitions):
+        first_lba = part.start // SECTOR_SIZE
+        last_lba = first_lba + part.size // SECTOR_SIZE - 1
+        if first_lba < first_usable or last_lba > last_usable:
+            raise ValueError(f"Partition {part.name} does not fit in the disk")
+        part_guid = uuid.uuid5(uuid.NAMESPACE_URL, f"dstack-part:{seed}:{i}:{part.name}")
+        struct.pack_into("<16s16sQQQ72s", entries, i * GPT_ENTRY_SIZE,
+                         part.type_guid.bytes_le, part_guid.bytes_le,
+                         first_lba, last_lba, 0, part.name.encode("utf-16-le"))
+    entries_crc = zlib.crc32(entries)
+
+    def header(current_lba: int, backup_lba: int, entries_lba: int) -> bytes:
+        fields = [b"EFI PART", 0x00010000, 92, 0, 0, current_lba, backup_lba,
+                  first_usable, last_usable, disk_guid.bytes_le, entries_lba,
+                  GPT_ENTRY_COUNT, GPT_ENTRY_SIZE, entries_crc]
+        fmt = "<8sIIIIQQQQ16sQIII"
+        fields[3] = zlib.crc32(struct.pack(fmt, *fields))
+        return struct.pack(fmt, *fields).ljust(SECTOR_SIZE, b"\0")
+
+    mbr = bytearray(SECTOR_SIZE)
+    struct.pack_into("<B3sB3sII", mbr, 446, 0, b"\x00\x02\x00", 0xEE,
+                     b"\xff\xff\xff", 1, min(total_sectors - 1, 0xFFFFFFFF))
+    mbr[510:512] = b"\x55\xaa"
+
+    backup_entries_lba = total_sectors - 1 - entry_sectors
+    os.pwrite(fd, mbr, 0)
+    os.pwrite(fd, header(1, total_sectors - 1, 2), SECTOR_SIZE)
+    os.pwrite(fd, entries, 2 * SECTOR_SIZE)
+    os.pwrite(fd, entries, backup_entries_lba * SECTOR_SIZE)
+    os.pwrite(fd, header(total_sectors - 1, 1, backup_entries_lba),
+              (total_sectors - 1) * SECTOR_SIZE)
+
+
+def _copy_range(src_fd: int, dst_fd: int, src_off: int, dst_off: int, length: int) -> None:
+    """Copy a byte range, preferring copy_file_range and skipping zero blocks otherwise."""
+    while length > 0:
+        try:
+            copied = os.copy_file_range(src_fd, dst_fd, min(length, COPY_CHUNK), src_off, dst_off)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+            copied = 0
+        if copied == 0:
+            break
+        src_off += copied
+        dst_off += copied
+        length -= copied
+
+    while length > 0:
+        data = os.pread(src_fd, min(length, COPY_CHUNK), src_off)
+        if not data:
+            raise OSError(errno.EIO, "Unexpected end of input")
+        if data.count(0) != len(data):
+            os.pwrite(dst_fd, data, dst_off)
+        src_off += len(data)
+        dst_off += len(data)
+        length -= len(data)
+
+
+def copy_sparse(src_path: str, dst_fd: int, dst_offset: int) -> int:
+    """Copy src_path into dst_fd at dst_offset, skipping holes in the source.
+
+    The destination must already be zero (e.g. freshly truncated) in the
+    target range.
+
+    Returns:
+        Size of the source file
+    """
+    with open(src_path, "rb") as src:
+        src_fd = src.fileno()
+        size = os.fstat(src_fd).st_size
+        pos = 0
+        while pos < size:
+            try:
+                data_start = os.lseek(src_fd, pos, os.SEEK_DATA)
+                data_end = os.lseek(src_fd, data_start, os.SEEK_HOLE)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    break
+                if e.errno != errno.EINVAL:
+                    raise
+                data_start, data_end = pos, size
+            _copy_range(src_fd, dst_fd, data_start, dst_offset + data_start,
+                        data_end - data_start)
+            pos = data_end
+    return size
+
+
+def _fat_dir_entry(name: bytes, attr: int, cluster: int, size: int = 0) -> bytes:
+    return struct.pack("<11sBBBHHHHHHHI", name, attr, 0, 0, FAT_TIME, FAT_DATE, FAT_DATE,
+                       cluster >> 16, FAT_TIME, FAT_DATE, cluster & 0xFFFF, size)
+
+
+def write_efi_fat(fd: int, offset: int, size: int, uki_path: str,
+                  volume_id: int, hidden_sectors: int = 0) -> None:
+    """Write a FAT32 filesystem containing only EFI/BOOT/BOOTX64.EFI.
+
+    The layout matches what mkfs.vfat + mmd + mcopy produce for a single
+    file: root, EFI and BOOT directories in clusters 2-4 followed by the
+    file in contiguous clusters. Only non-zero metadata and the file data
+    are written.
+    """
+    total_sectors = size // SECTOR_SIZE
+    sectors_per_cluster = 1
+    cluster_size = sectors_per_cluster * SECTOR_SIZE
+
+    fat_sectors = 1
+    while True:
+        data_sectors = total_sectors - FAT_RESERVED_SECTORS - FAT_COUNT * fat_sectors
+        cluster_count = data_sectors // sectors_per_cluster
+        needed = -(-(cluster_count + 2) * 4 // SECTOR_SIZE)
+        if needed <= fat_sectors:
+            break
+        fat_sectors = needed
+    if cluster_count < 65525:
+        raise ValueError(f"EFI partition of {size} bytes is too small for FAT32")
+
+    uki_size = os.path.getsize(uki_path)
+    file_clusters = -(-uki_size // cluster_size)
+    if 5 + file_clusters > cluster_count + 2:
+        raise ValueError(f"{uki_path} does not fit in the EFI partition")
+    root_cluster, efi_cluster, boot_cluster, file_cluster = 2, 3, 4, 5
+    if file_clusters == 0:
+        file_cluster = 0
+
+    data_offset = offset + (FAT_RESERVED_SECTORS + FAT_COUNT * fat_sectors) * SECTOR_SIZE
+
+    def cluster_offset(cluster: int) -> int:
+        return data_offset + (cluster - 2) * cluster_size
+
+    label = FAT_VOLUME_LABEL.encode().ljust(11)
+
+    boot = bytearray(SECTOR_SIZE)
+    struct.pack_into("<3s8sHBHBHHBHHHII", boot, 0,
+                     b"\xeb\x58\x90", b"mkfs.fat", SECTOR_SIZE, sectors_per_cluster,
+                     FAT_RESERVED_SECTORS, FAT_COUNT, 0, 0, 0xF8, 0, 32, 64,
+                     hidden_sectors, total_sectors)
+    struct.pack_into("<IHHIHH12sBBBI11s8s", boot, 36,
+                     fat_sectors, 0, 0, root_cluster, 1, 6, b"", 0x80, 0, 0x29,
+                     volume_id, label, b"FAT32   ")
+    boot[510:512] = b"\x55\xaa"
+
+    free_clusters = cluster_count - 3 - file_clusters
+    fsinfo = bytearray(SECTOR_SIZE)
+    struct.pack_into("<I", fsinfo, 0, 0x41615252)
+    struct.pack_into("<III", fsinfo, 484, 0x61417272, free_clusters, 5 + file_clusters)
+    struct.pack_into("<I", fsinfo, 508, 0xAA550000)
+
+    for base in (0, 6):
+        os.pwrite(fd, boot, offset + base * SECTOR_SIZE)
+        os.pwrite(fd, fsinfo, offset + (base + 1) * SECTOR_SIZE)
+        os.pwrite(fd, b"\0" * 510 + b"\x55\xaa", offset + (base + 2) * SECTOR_SIZE)
+
+    fat = [0x0FFFFFF8, FAT_EOC, FAT_EOC, FAT_EOC, FAT_EOC]
+    fat.extend(range(file_cluster + 1, file_cluster + file_clusters))
+    if file_clusters:
+        fat.append(FAT_EOC)
+    fat_bytes = struct.pack(f"<{len(fat)}I", *fat)
+    for i in range(FAT_COUNT):
+        fat_offset = offset + (FAT_RESERVED_SECTORS + i * fat_sectors) * SECTOR_SIZE
+        os.pwrite(fd, fat_bytes, fat_offset)
+
+    root = _fat_dir_entry(label, 0x08, 0) + _fat_dir_entry(b"EFI        ", 0x10, efi_cluster)
+    efi_dir = (_fat_dir_entry(b".          ", 0x10, efi_cluster)
+               + _fat_dir_entry(b"..         ", 0x10, 0)
+               + _fat_dir_entry(b"BOOT       ", 0x10, boot_cluster))
+    boot_dir = (_fat_dir_entry(b".          ", 0x10, boot_cluster)
+                + _fat_dir_entry(b"..         ", 0x10, efi_cluster)
+                + _fat_dir_entry(b"BOOTX64 EFI", 0x20, file_cluster, uki_size))
+    os.pwrite(fd, root, cluster_offset(root_cluster))
+    os.pwrite(fd, efi_dir, cluster_offset(efi_cluster))
+    os.pwrite(fd, boot_dir, cluster_offset(boot_cluster))
+
+    if file_clusters:
+        copy_sparse(uki_path, fd, cluster_offset(file_cluster))
+
+
+def _file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(COPY_CHUNK)
+            if not block:
+                return crc
+            crc = zlib.crc32(block, crc)
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(COPY_CHUNK)
+            if not block:
+                return digest.hexdigest()
+            digest.update(block)
+
+
+def _create_disk(output: str, size: int) -> int:
+    fd = os.open(output, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.ftruncate(fd, size)
+    return fd
+
+
+def create_partitioned_rootfs(rootfs_img: str, output_img: str,
+                              rootfs_seed: Optional[str] = None) -> None:
+    """Build a GPT disk with the rootfs in a single 'dstack-rootfs' partition.
+
+    rootfs_seed identifies the rootfs contents for the GUIDs; the sha256 of
+    rootfs_img is used if it is not given.
+    """
+    rootfs_seed = rootfs_seed or _file_sha256(rootfs_img)
+    rootfs_size_aligned = align_up(os.path.getsize(rootfs_img), ALIGN)
+    rootfs_start = ALIGN
+    # Leave extra room for GPT headers (1MB at start, 1MB at end)
+    total_size = align_up(rootfs_start + rootfs_size_aligned + ALIGN, ALIGN)
+
+    fd = _create_disk(output_img, total_size)
+    try:
+        write_gpt(fd, total_size, [
+            Partition("dstack-rootfs", GPT_LINUX_FS_TYPE, rootfs_start, rootfs_size_aligned),
+        ], seed=f"rootfs:{rootfs_seed}")
+        copy_sparse(rootfs_img, fd, rootfs_start)
+    finally:
+        os.close(fd)
+
+
+def build_uki_disk_image(disk_img: str, uki_file: str, rootfs_img: str,
+                         auth_hash_file: Optional[str] = None,
+                         rootfs_seed: Optional[str] = None) -> None:
+    """Build a GPT disk with an EFI System Partition booting the UKI and the rootfs.
+
+    The GUIDs are derived from the sha256 of the UKI and rootfs_seed (the
+    sha256 of rootfs_img if not given).
+    """
+    seed = f"uki:{_file_sha256(uki_file)}:{rootfs_seed or _file_sha256(rootfs_img)}"
+    efi_size_aligned = align_up(EFI_SIZE, ALIGN)
+    rootfs_size_aligned = align_up(os.path.getsize(rootfs_img), ALIGN)
+    efi_start = ALIGN
+    rootfs_start = efi_start + efi_size_aligned
+    # Leave extra room for the backup GPT header
+    total_size = align_up(rootfs_start + rootfs_size_aligned + ALIGN, ALIGN)
+
+    fd = _create_disk(disk_img, total_size)
+    try:
+        write_gpt(fd, total_size, [
+            Partition("EFI System Partition", GPT_EFI_SYSTEM_TYPE, efi_start, efi_size_aligned),
+            Partition("dstack-rootfs", GPT_LINUX_FS_TYPE, rootfs_start, rootfs_size_aligned),
+        ], seed=seed)
+        write_efi_fat(fd, efi_start, efi_size_aligned, uki_file,
+                      volume_id=_file_crc32(uki_file),
+                      hidden_sectors=efi_start // SECTOR_SIZE)
+        copy_sparse(rootfs_img, fd, rootfs_start)
+    finally:
+        os.close(fd)
+
+    if auth_hash_file:
+        from authenticode_hash import authenticode_hash
+
+        auth_hash = authenticode_hash(uki_file)
+        with open(auth_hash_file, "w") as f:
+            f.write(auth_hash + "\n")
+        print(f"UKI Authenticode hash: {auth_hash}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Assemble dstack disk images')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rootfs_parser = subparsers.add_parser('rootfs', help='Create the partitioned rootfs image')
+    rootfs_parser.add_argument('rootfs', help='Path to the rootfs (squashfs + verity) image')
+    rootfs_parser.add_argument('output', help='Output disk image')
+
+    uki_parser = subparsers.add_parser('uki', help='Create the UKI boot disk image')
+    uki_parser.add_argument('uki', help='Path to the UKI .efi')
+    uki_parser.add_argument('rootfs', help='Path to the rootfs (squashfs + verity) image')
+    uki_parser.add_argument('output', help='Output disk image')
+    uki_parser.add_argument('--auth-hash', type=str,
+                            help='Write the UKI Authenticode hash to this file')
+    for sub in (rootfs_parser, uki_parser):
+        sub.add_argument('--rootfs-seed', type=str,
+                         help='String identifying the rootfs contents, e.g. its dm-verity '
+                              'root hash (default: sha256 of the rootfs image)')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'rootfs':
+            create_partitioned_rootfs(args.rootfs, args.output, args.rootfs_seed)
+        else:
+            build_uki_disk_image(args.output, args.uki, args.rootfs, args.auth_hash,
+                                 args.rootfs_seed)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+"""
+Compute expected TDX measurements for a dstack image without booting it.
+
+Inputs are the files of an image directory (metadata.json, ovmf.fd,
+bzImage, initramfs.cpio.gz, digest.txt) and the vCPU/memory values that
+gen_vm_config writes into vm_config. Results are cached per
+(image digest, memory) under ~/.cache/dstack/measurements.
+
+MRTD, RTMR1 and RTMR2 are derived from the artifacts alone; the vCPU count
+does not affect any of them. RTMR0 also covers the ACPI tables QEMU
+generates at launch (which is where the vCPU count ends up), so it is not
+computed and is listed under "not_computed" in the output.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from authenticode_hash import authenticode_hash_data
+
+CACHE_DIR = os.path.expanduser("~/.cache/dstack/measurements")
+
+# Registers this tool cannot compute from the image artifacts
+NOT_COMPUTED = ["rtmr0"]
+
+PAGE_SIZE = 4096
+MR_EXTEND_CHUNK = 256
+
+OVMF_TABLE_FOOTER_GUID = uuid.UUID("96b582de-1fb2-45f7-baea-a366c55a082d")
+TDX_METADATA_OFFSET_GUID = uuid.UUID("e47a6535-984a-4798-865e-4685a7bf8ec2")
+TDVF_SIGNATURE = b"TDVF"
+
+TDVF_SECTION_BFV = 0
+TDVF_SECTION_CFV = 1
+TDVF_SECTION_PERM_MEM = 4
+TDVF_ATTR_MR_EXTEND = 1 << 0
+TDVF_ATTR_PAGE_AUG = 1 << 1
+
+# QEMU reserves this much below the top of low memory for ACPI data
+ACPI_DATA_SIZE = 0x20000 + 0x8000
+
+
+@dataclass
+class TdvfSection:
+    data_offset: int
+    raw_data_size: int
+    memory_address: int
+    memory_data_size: int
+    section_type: int
+    attributes: int
+
+
+def parse_tdvf_sections(fw: bytes) -> List[TdvfSection]:
+    """Parse the TDX metadata sections from an OVMF/TDVF image."""
+    # The GUIDed table ends 32 bytes before the end of the image and is
+    # walked backwards: each entry is <data><u16 length><guid>.
+    table_end = len(fw) - 32
+    footer = uuid.UUID(bytes_le=fw[table_end - 16:table_end])
+    if footer != OVMF_TABLE_FOOTER_GUID:
+        raise ValueError("OVMF GUIDed table footer not found")
+    table_len = struct.unpack_from("<H", fw, table_end - 18)[0]
+    table_start = table_end - table_len
+    pos = table_end - 18
+
+    metadata_offset = None
+    while pos > table_start:
+        guid = uuid.UUID(bytes_le=fw[pos - 16:pos])
+        entry_len = struct.unpack_from("<H", fw, pos - 18)[0]
+        if entry_len < 18:
+            raise ValueError("Malformed OVMF GUIDed table")
+        if guid == TDX_METADATA_OFFSET_GUID:
+            metadata_offset = len(fw) - struct.unpack_from("<I", fw, pos - entry_len)[0]
+            break
+        pos -= entry_len
+    if metadata_offset is None:
+        raise ValueError("TDX metadata not found in firmware")
+
+    signature, _length, _version, count = struct.unpack_from("<4sIII", fw, metadata_offset)
+    if signature != TDVF_SIGNATURE:
+        raise ValueError("Invalid TDVF metadata signature")
+
+    sections = []
+    for i in range(count):
+        fields = struct.unpack_from("<IIQQII", fw, metadata_offset + 16 + i * 32)
+        sections.append(TdvfSection(*fields))
+    return sections
+
+
+def compute_mrtd(fw: bytes) -> str:
+    """Replay TDH.MEM.PAGE.ADD/TDH.MR.EXTEND for the firmware sections.
+
+    Pages are added and extended one at a time, in section order, like
+    KVM's KVM_TDX_INIT_MEM_REGION.
+    """
+    h = hashlib.sha384()
+    for section in parse_tdvf_sections(fw):
+        if section.attributes & TDVF_ATTR_PAGE_AUG or section.section_type == TDVF_SECTION_PERM_MEM:
+            continue
+        extend = section.attributes & TDVF_ATTR_MR_EXTEND
+        if section.section_type in (TDVF_SECTION_BFV, TDVF_SECTION_CFV):
+            data = fw[section.data_offset:section.data_offset + section.raw_data_size]
+        elif extend:
+            raise ValueError(f"Cannot measure runtime-populated section type {section.section_type}")
+        else:
+            data = b""
+        data = data.ljust(section.memory_data_size, b"\0")
+
+        for page in range(0, section.memory_data_size, PAGE_SIZE):
+            gpa = section.memory_address + page
+            h.update(struct.pack("<16sQ", b"MEM.PAGE.ADD", gpa).ljust(128, b"\0"))
+            if not extend:
+                continue
+            for chunk in range(page, page + PAGE_SIZE, MR_EXTEND_CHUNK):
+                h.update(struct.pack("<16sQ", b"MR.EXTEND", section.memory_address + chunk).ljust(128, b"\0"))
+                h.update(data[chunk:chunk + MR_EXTEND_CHUNK])
+    return h.hexdigest()
+
+
+def replay_rtmr(digests: List[bytes]) -> str:
+    """Replay RTMR extends starting from an all-zero register."""
+    rtmr = bytes(48)
+    for digest in digests:
+        rtmr = hashlib.sha384(rtmr + digest).digest()
+    return rtmr.hex()
+
+
+def patch_kernel(kernel: bytes, initrd_size: int, memory_size: int) -> bytes:
+    """Apply the setup header changes QEMU makes before handing the kernel to OVMF."""
+    kd = bytearray(kernel)
+    protocol = 0
+    if kd[0x202:0x206] == b"HdrS":
+        protocol = struct.unpack_from("<H", kd, 0x206)[0]
+
+    if protocol < 0x200 or not kd[0x211] & 0x01:
+        real_addr, cmdline_addr = 0x90000, 0x9a000
+    else:
+        real_addr, cmdline_addr = 0x10000, 0x20000
+
+    if protocol >= 0x200:
+        kd[0x210] = 0xb0
+    if protocol >= 0x201:
+        kd[0x211] |= 0x80
+        struct.pack_into("<H", kd, 0x224, cmdline_addr - real_addr - 0x200)
+    if protocol >= 0x202:
+        struct.pack_into("<I", kd, 0x228, cmdline_addr)
+    else:
+        struct.pack_into("<HH", kd, 0x20, 0xa33f, cmdline_addr - real_addr)
+
+    if initrd_size:
+        if protocol >= 0x20c and struct.unpack_from("<H", kd, 0x236)[0] & 0x2:
+            initrd_max = 0xffffffff
+        elif protocol >= 0x203:
+            initrd_max = struct.unpack_from("<I", kd, 0x22c)[0]
+        else:
+            initrd_max = 0x37ffffff
+        below_4g = memory_size if memory_size < 0xb0000000 else 0x80000000
+        if initrd_max >= below_4g - ACPI_DATA_SIZE:
+            initrd_max = below_4g - ACPI_DATA_SIZE - 1
+        initrd_addr = (initrd_max - initrd_size) & ~(PAGE_SIZE - 1)
+        struct.pack_into("<II", kd, 0x218, initrd_addr, initrd_size)
+    return bytes(kd)
+
+
+def compute_rtmr1(kernel: bytes, initrd_size: int, memory_size: int) -> str:
+    kernel_hash = authenticode_hash_data(patch_kernel(kernel, initrd_size, memory_size),
+                                         'sha384', 'bzImage')
+    return replay_rtmr([
+        bytes.fromhex(kernel_hash),
+        hashlib.sha384(b"Calling EFI Application from Boot Option").digest(),
+        hashlib.sha384(bytes(4)).digest(),
+        hashlib.sha384(b"Exit Boot Services Invocation").digest(),
+        hashlib.sha384(b"Exit Boot Services Returned with Success").digest(),
+    ])
+
+
+def compute_rtmr2(cmdline: str, initrd_hash: bytes) -> str:
+    # OVMF measures the UTF-16 command line including the initrd= argument
+    # it adds for the QEMU-provided initrd
+    cmdline_utf16 = (cmdline + " initrd=initrd").encode("utf-16-le") + b"\0\0"
+    return replay_rtmr([hashlib.sha384(cmdline_utf16).digest(), initrd_hash])
+
+
+def _read_image_digest(image_dir: str) -> str:
+    with open(os.path.join(image_dir, "digest.txt"), "r") as f:
+        return f.read().strip()
+
+
+def _load_cache(digest: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(CACHE_DIR, f"{digest}.json"), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_cache(digest: str, cache: Dict[str, dict]) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=".measure-")
+    with os.fdopen(fd, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, os.path.join(CACHE_DIR, f"{digest}.json"))
+
+
+def measure_image(image_dir: str, configs: List[tuple], use_cache: bool = True) -> List[dict]:
+    """Compute measurements for each (vcpu, memory_size) pair.
+
+    memory_size is in bytes, as in vm_config. vcpu is only echoed in the
+    result as cpu_count, since none of the computed registers depend on it.
+    Artifacts are only read when a memory size is missing from the cache.
+    """
+    digest = _read_image_digest(image_dir)
+    cache = _load_cache(digest) if use_cache else {}
+
+    missing = sorted({memory_size for _, memory_size in configs if str(memory_size) not in cache})
+    if missing:
+        with open(os.path.join(image_dir, "metadata.json"), "r") as f:
+            metadata = json.load(f)
+
+        def read(key: str) -> bytes:
+            with open(os.path.join(image_dir, metadata[key]), "rb") as f:
+                return f.read()
+
+        mrtd = compute_mrtd(read("bios"))
+        kernel = read("kernel")
+        initrd = read("initrd")
+        rtmr2 = compute_rtmr2(metadata["cmdline"], hashlib.sha384(initrd).digest())
+
+        for memory_size in missing:
+            cache[str(memory_size)] = {
+                "mrtd": mrtd,
+                "rtmr1": compute_rtmr1(kernel, len(initrd), memory_size),
+                "rtmr2": rtmr2,
+            }
+        if use_cache:
+            _save_cache(digest, cache)
+
+    return [
+        {"os_image_hash": digest, "cpu_count": vcpu, "memory_size": memory_size,
+         **cache[str(memory_size)], "not_computed": list(NOT_COMPUTED)}
+        for vcpu, memory_size in configs
+    ]
+
+
+def parse_memory(memory: str) -> int:
+    """Convert a memory string (e.g. 2G, 512M, or MB as a bare number) to bytes."""
+    units = {'T': 1024 * 1024, 'G': 1024, 'M': 1}
+    suffix = memory[-1:].upper()
+    if suffix in units:
+        return int(memory[:-1]) * units[suffix] * 1024 * 1024
+    return int(memory) * 1024 * 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Compute expected TDX measurements (MRTD/RTMRs) from image artifacts'
+    )
+    parser.add_argument('image', help='Image directory containing metadata.json and digest.txt')
+    parser.add_argument('-c', '--vcpu', type=int, default=1, help='Number of vCPUs')
+    parser.add_argument('-m', '--memory', type=str, default='2G', help='Memory size (e.g., 1G, 512M)')
+    parser.add_argument('--config', action='append', type=str, metavar='VCPU:MEMORY',
+                        help='Configuration to measure, e.g. 8:16G (may be repeated)')
+    parser.add_argument('--vm-config', type=str,
+                        help='vm_config JSON as written by gen_vm_config')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the cache')
+    args = parser.parse_args()
+
+    if args.vm_config:
+        vm_config = json.loads(args.vm_config)
+        configs = [(vm_config["cpu_count"], vm_config["memory_size"])]
+    elif args.config:
+        configs = []
+        for item in args.config:
+            vcpu, _, memory = item.partition(':')
+            configs.append((int(vcpu), parse_memory(memory)))
+    else:
+        configs = [(args.vcpu, parse_memory(args.memory))]
+
+    try:
+        results = measure_image(args.image, configs, use_cache=not args.no_cache)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(results if len(results) > 1 else results[0], indent=2))
+    print("Note: RTMR0 is not computed; it covers the ACPI tables QEMU generates "
+          "at launch. Take it from a reference boot of the same VM configuration.",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/bin/sh
+# Time loading the guest configuration from the host-shared directory over
+# 9p and over virtiofs. Run as root inside a guest created with
+# 'dstack.py new --shared-fs virtiofs', which attaches both transports
+# under the host-shared tag.
+#
+# Usage: shared-fs-load.sh [ROUNDS]
+set -e
+
+ROUNDS=${1:-20}
+FILES="app-compose.json .sys-config.json .instance_info .encrypted-env"
+
+load_config() {
+    dir=$1
+    for f in $FILES; do
+        [ -f "$dir/$f" ] && cat "$dir/$f" >/dev/null
+    done
+    [ -d "$dir/certs" ] && find "$dir/certs" -type f -exec cat {} + >/dev/null
+    true
+}
+
+now_ns() {
+    date +%s%N
+}
+
+measure() {
+    fstype=$1
+    shift
+    mnt=$(mktemp -d)
+    if ! mount -t "$fstype" "$@" host-shared "$mnt" 2>/dev/null; then
+        echo "$fstype: mount failed"
+        rmdir "$mnt"
+        return
+    fi
+    total=0
+    first=0
+    i=0
+    while [ "$i" -lt "$ROUNDS" ]; do
+        # Remount so every round starts with cold dentry and page caches
+        umount "$mnt"
+        mount -t "$fstype" "$@" host-shared "$mnt"
+        start=$(now_ns)
+        load_config "$mnt"
+        elapsed=$(( $(now_ns) - start ))
+        [ "$i" -eq 0 ] && first=$elapsed
+        total=$((total + elapsed))
+        i=$((i + 1))
+    done
+    umount "$mnt"
+    rmdir "$mnt"
+    echo "$fstype: first $((first / 1000)) us, mean $((total / ROUNDS / 1000)) us over $ROUNDS rounds"
+}
+
+measure 9p -o trans=virtio,version=9p2000.L
+measure virtiofs